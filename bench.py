@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Connections Airport App routes at growing data sizes
+
+For each size the harness writes synthetic airport_profiles.csv and
+messages.csv files with that many rows into a scratch directory, starts a
+fresh Python process there and drives the routes through Flask's test
+client. It reports p50/p95/p99 latency and throughput per route as JSON,
+and can compare a run against a stored baseline.
+
+  python bench.py --sizes 1000,10000 --output bench.json
+  python bench.py --baseline bench.json --tolerance 0.25
+
+Data is generated from --seed, so runs with the same arguments are
+comparable.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from storage import MESSAGE_FIELDS, PROFILE_FIELDS, RECEIPT_FIELDS, SCHEMA_VERSION, VERIFICATION_FIELDS, migrate_csv_to_sqlite
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+ROUTES = ['checkin_get', 'checkin_post', 'send_message', 'flight_status', 'verify_profile']
+
+AIRPORTS = ['SFO', 'LAX', 'JFK', 'ORD', 'ATL', 'SEA', 'BOS', 'DFW', 'DEN', 'MIA']
+TERMINALS = ['Terminal 1', 'Terminal 2', 'Terminal 3', 'Terminal 4', 'Terminal 5']
+DESTINATIONS = ['New York', 'London', 'Tokyo', 'Paris', 'Chicago', 'Sydney', 'Toronto', 'Berlin']
+PURPOSES = ['Business', 'Leisure', 'Family Visit', 'Study Abroad', 'Other']
+INTERESTS = ['Travel', 'Business', 'Food & Dining', 'Technology', 'Sports', 'Music', 'Art & Culture', 'Reading']
+
+BENCH_USER = 'Bench Traveler'
+
+
+def traveler_name(number):
+    return 'Traveler %d' % number
+
+
+def generate_data(data_dir, size, seed):
+    """Write size profiles and size messages (plus empty verification and receipt files)"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    # Enough distinct people that per-user message lists grow with the data
+    people = max(100, size // 50)
+
+    def profiles():
+        for number in range(size):
+            checked_in = now - timedelta(minutes=rng.randrange(240))
+            departure = now + timedelta(minutes=rng.randrange(30, 600))
+            yield [traveler_name(number % people), str(rng.randrange(18, 70)), 'Synthetic traveler', rng.choice(AIRPORTS),
+                   rng.choice(TERMINALS), 'A%d' % rng.randrange(1, 40), 'BT%d' % rng.randrange(100, 999), departure.strftime('%H:%M'),
+                   rng.choice(DESTINATIONS), rng.choice(PURPOSES), ', '.join(rng.sample(INTERESTS, rng.randrange(1, 4))),
+                   'Window seat, always', '100', 'True', 'False', checked_in.strftime('%Y-%m-%d %H:%M:%S')]
+
+    def messages():
+        for number in range(size):
+            sender = BENCH_USER if number % 100 == 0 else traveler_name(rng.randrange(people))
+            recipient = BENCH_USER if number % 100 == 1 else traveler_name(rng.randrange(people))
+            sent_at = now - timedelta(seconds=size - number)
+            yield [sender, recipient, 'Synthetic message %d' % number, sent_at.strftime('%Y-%m-%d %H:%M:%S'), rng.choice(['True', 'False'])]
+
+    for filename, fields, rows in [('airport_profiles.csv', PROFILE_FIELDS, profiles()),
+                                   ('messages.csv', MESSAGE_FIELDS, messages()),
+                                   ('verifications.csv', VERIFICATION_FIELDS, ()),
+                                   ('read_receipts.csv', RECEIPT_FIELDS, ())]:
+        with open(os.path.join(data_dir, filename), 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            writer.writerows(rows)
+    with open(os.path.join(data_dir, 'schema_version'), 'w') as file:
+        file.write('%d\n' % SCHEMA_VERSION)
+    return people
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, cold):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {'requests': len(latencies),
+            'cold_ms': round(cold * 1000, 3),
+            'mean_ms': round(total / len(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'rps': round(len(latencies) / total, 1) if total else 0.0}
+
+
+def route_calls(people, rng):
+    """Callables issuing one request per route, each returning the response"""
+    form = {'name': BENCH_USER, 'age': '30', 'bio': 'Benchmarking', 'airport': 'SFO', 'terminal': 'Terminal 2', 'gate': 'A1',
+            'flight_number': 'BT100', 'departure_time': (datetime.now() + timedelta(hours=3)).strftime('%H:%M'),
+            'destination': 'London', 'travel_purpose': 'Business', 'interests': ['Travel', 'Music'],
+            'icebreaker_response': 'Window seat'}
+    return {
+        'checkin_get': lambda client: client.get('/'),
+        'checkin_post': lambda client: client.post('/', data=form),
+        'send_message': lambda client: client.post('/send_message', json={'to_name': traveler_name(rng.randrange(people)), 'message': 'Coffee?'}),
+        'flight_status': lambda client: client.get('/flight_status/BT%d' % rng.randrange(100, 999)),
+        'verify_profile': lambda client: client.post('/verify_profile', json={'name': traveler_name(rng.randrange(people)), 'type': 'ID'}),
+    }
+
+
+def run_worker(people, requests, warmup, routes, seed, result_path):
+    """Runs inside the scratch directory: import the app and time each route"""
+    started = time.perf_counter()
+    import main
+    results = {'import_ms': round((time.perf_counter() - started) * 1000, 3), 'routes': {}}
+    client = main.app.test_client()
+    calls = route_calls(people, random.Random(seed))
+    for route in routes:
+        call = calls[route]
+        started = time.perf_counter()
+        response = call(client)
+        cold = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise SystemExit('%s returned HTTP %d' % (route, response.status_code))
+        for _ in range(warmup):
+            call(client)
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            call(client)
+            latencies.append(time.perf_counter() - started)
+        results['routes'][route] = summarize(latencies, cold)
+    with open(result_path, 'w') as file:
+        json.dump(results, file)
+
+
+def bench_size(size, args):
+    data_dir = tempfile.mkdtemp(prefix='connections-bench-%d-' % size)
+    try:
+        started = time.perf_counter()
+        people = generate_data(data_dir, size, args.seed)
+        if args.backend == 'sqlite':
+            migrate_csv_to_sqlite(os.path.join(data_dir, 'connections.db'), *[os.path.join(data_dir, name) for name in
+                                  ('airport_profiles.csv', 'messages.csv', 'verifications.csv', 'read_receipts.csv')])
+        generate_seconds = time.perf_counter() - started
+        result_path = os.path.join(data_dir, 'result.json')
+        env = dict(os.environ, STORAGE_BACKEND=args.backend, DATABASE_FILE='connections.db', EVENTS_PORT='0')
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--people', str(people), '--requests', str(args.requests),
+                   '--warmup', str(args.warmup), '--routes', ','.join(args.routes), '--seed', str(args.seed), '--result', result_path]
+        subprocess.run(command, cwd=data_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_path) as file:
+            result = json.load(file)
+        result['generate_s'] = round(generate_seconds, 3)
+        return result
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """Print p95 changes against a baseline run; returns the regressions beyond tolerance"""
+    regressions = []
+    for key in ('backend', 'requests', 'seed'):
+        if baseline.get('meta', {}).get(key) != results['meta'][key]:
+            print('⚠️  baseline was run with a different %s (%s)' % (key, baseline.get('meta', {}).get(key)), file=sys.stderr)
+    for size, current in results['sizes'].items():
+        previous = baseline.get('sizes', {}).get(size)
+        if previous is None:
+            continue
+        for route, stats in current['routes'].items():
+            before = previous['routes'].get(route)
+            if before is None or not before['p95_ms']:
+                continue
+            change = stats['p95_ms'] / before['p95_ms'] - 1
+            flag = ''
+            if change > tolerance:
+                flag = '  ⚠️  regression'
+                regressions.append((size, route, change))
+            print('%9s %-15s p95 %9.3f ms -> %9.3f ms (%+.1f%%)%s' % (size, route, before['p95_ms'], stats['p95_ms'], change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Connections Airport App routes at growing data sizes')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help='comma-separated row counts')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated routes to drive (%s)' % ', '.join(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route and size')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per route before timing')
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results JSON here (default: stdout)')
+    parser.add_argument('--baseline', help='results JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown against the baseline (0.2 = 20%%)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--people', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.routes = [route for route in args.routes.split(',') if route]
+    unknown = sorted(set(args.routes) - set(ROUTES))
+    if unknown:
+        parser.error('unknown route(s): %s' % ', '.join(unknown))
+
+    if args.worker:
+        run_worker(args.people, args.requests, args.warmup, args.routes, args.seed, args.result)
+        return
+
+    results = {'meta': {'started': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                        'platform': platform.platform(), 'backend': args.backend, 'requests': args.requests,
+                        'warmup': args.warmup, 'seed': args.seed},
+               'sizes': {}}
+    for size in [int(size) for size in args.sizes.split(',') if size]:
+        print('⏱️  %s rows...' % format(size, ','), file=sys.stderr)
+        results['sizes'][str(size)] = bench_size(size, args)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            sys.exit('❌ %d route(s) slower than the baseline by more than %d%%' % (len(regressions), args.tolerance * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Bulk import and export for Connections Airport App data files
+
+Streams CSV or JSONL dumps into the app's CSV files, or the files out to a
+dump, a chunk of rows at a time, so memory stays flat however large the
+file is. Imported records are checked against the headers init_csv()
+creates; each chunk is appended with one write and one fsync under the
+same lock the running app uses, so imports can run while it serves.
+
+  python bulk.py import messages messages.jsonl
+  python bulk.py export profiles - --format csv > profiles.csv
+
+Use '-' for stdin/stdout. The format follows the file extension unless
+--format is given.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from storage import MESSAGE_FIELDS, PROFILE_FIELDS, VERIFICATION_FIELDS, CsvStorage, align_row
+from writer import file_lock
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# table: (data file, columns, defaults for columns a dump may leave out, columns ignored on import)
+TABLES = {
+    'profiles': ('airport_profiles.csv', PROFILE_FIELDS, {'Is_Verified': 'False'}, ()),
+    'messages': ('messages.csv', MESSAGE_FIELDS, {'Is_Read': 'False'}, ('Message_ID',)),
+    'verifications': ('verifications.csv', VERIFICATION_FIELDS, {}, ()),
+}
+
+
+class InvalidRecord(ValueError):
+    """A dump record that does not fit the table's columns"""
+
+    def __init__(self, line, message):
+        super().__init__('line %d: %s' % (line, message))
+        self.line = line
+
+
+class Progress:
+    """Row counter that reports throughput to stderr about once per interval"""
+
+    def __init__(self, label, interval=1.0, stream=sys.stderr, enabled=True):
+        self.label = label
+        self.interval = interval
+        self.stream = stream
+        self.enabled = enabled
+        self.rows = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+        self._reported = self.started
+
+    def advance(self, rows):
+        self.rows += rows
+        now = time.monotonic()
+        if self.enabled and now - self._reported >= self.interval:
+            self._reported = now
+            self._report(now)
+
+    def _report(self, now, final=False):
+        elapsed = max(now - self.started, 1e-9)
+        line = '%s: %s rows in %.1fs (%s rows/s)' % (self.label, format(self.rows, ','), elapsed, format(int(self.rows / elapsed), ','))
+        if self.skipped:
+            line += ', %s skipped' % format(self.skipped, ',')
+        self.stream.write(line + ('\n' if final else '\r'))
+        self.stream.flush()
+
+    def finish(self):
+        if self.enabled:
+            self._report(time.monotonic(), final=True)
+
+
+def _open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _open_output(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def detect_format(path, requested=None):
+    if requested:
+        return requested
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _check_columns(line, columns, fields, defaults, ignored):
+    unknown = [name for name in columns if name not in fields and name not in ignored]
+    missing = [name for name in fields if name not in columns and name not in defaults]
+    if unknown:
+        raise InvalidRecord(line, 'unknown column(s) %s' % ', '.join(unknown))
+    if missing:
+        raise InvalidRecord(line, 'missing column(s) %s' % ', '.join(missing))
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def read_csv_records(file, fields, defaults, ignored):
+    """Yield (line, values) aligned to fields; the header is validated once"""
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    _check_columns(1, header, fields, defaults, ignored)
+    for values in reader:
+        if not values:
+            continue
+        if len(values) != len(header):
+            yield reader.line_num, InvalidRecord(reader.line_num, 'expected %d values, found %d' % (len(header), len(values)))
+            continue
+        yield reader.line_num, align_row(header, values, fields, defaults)
+
+
+def read_jsonl_records(file, fields, defaults, ignored):
+    """Yield (line, values) aligned to fields, one JSON object per line"""
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+            if not isinstance(record, dict):
+                raise ValueError('expected a JSON object')
+            _check_columns(line, record, fields, defaults, ignored)
+        except InvalidRecord as e:
+            yield line, e
+            continue
+        except ValueError as e:
+            yield line, InvalidRecord(line, str(e))
+            continue
+        yield line, [_text(record[name]) if name in record else defaults[name] for name in fields]
+
+
+def prepare_data_files(data_dir):
+    paths = [os.path.join(data_dir, TABLES[table][0]) for table in ('profiles', 'messages', 'verifications')]
+    CsvStorage(*paths, os.path.join(data_dir, 'read_receipts.csv')).init_schema()
+
+
+def append_chunk(path, rows):
+    """Append rows with one write and one fsync under the app's lock for path"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    with file_lock(path + '.lock'), open(path, 'ab') as file:
+        file.write(buffer.getvalue().encode('utf-8'))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def import_table(table, source, data_dir='.', file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, skip_invalid=False, progress=None):
+    """Stream a dump into a table's data file; returns (rows imported, rows skipped)"""
+    filename, fields, defaults, ignored = TABLES[table]
+    path = os.path.join(data_dir, filename)
+    reader = read_jsonl_records if detect_format(source, file_format) == 'jsonl' else read_csv_records
+    progress = progress or Progress(table, enabled=False)
+    chunk = []
+    with _open_input(source) as file:
+        for line, values in reader(file, fields, defaults, ignored):
+            if isinstance(values, InvalidRecord):
+                if not skip_invalid:
+                    raise values
+                progress.skipped += 1
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                append_chunk(path, chunk)
+                progress.advance(len(chunk))
+                chunk = []
+    if chunk:
+        append_chunk(path, chunk)
+        progress.advance(len(chunk))
+    progress.finish()
+    return progress.rows, progress.skipped
+
+
+def _complete_lines(path):
+    # Read only what existed at the start, and never a row another process is still writing
+    with open(path, 'rb') as file:
+        remaining = os.fstat(file.fileno()).st_size
+        for line in file:
+            remaining -= len(line)
+            if remaining < 0 or not line.endswith(b'\n'):
+                return
+            yield line.decode('utf-8')
+
+
+def _read_ids(receipts_path):
+    if not os.path.exists(receipts_path):
+        return set()
+    with open(receipts_path, 'r', newline='') as file:
+        return {int(record[0]) for record in csv.reader(file) if record and record[0].isdigit()}
+
+
+def export_table(table, target, data_dir='.', file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Stream a table's data file out as CSV or JSONL; returns the number of rows written"""
+    filename, fields, defaults, _ = TABLES[table]
+    path = os.path.join(data_dir, filename)
+    # Messages carry read state in the receipt log until it is compacted
+    read_ids = _read_ids(os.path.join(data_dir, 'read_receipts.csv')) if table == 'messages' else set()
+    is_read = fields.index('Is_Read') if read_ids else None
+    jsonl = detect_format(target, file_format) == 'jsonl'
+    progress = progress or Progress(table, enabled=False)
+    with _open_output(target) as output:
+        writer = None if jsonl else csv.writer(output)
+        if writer is not None:
+            writer.writerow(fields)
+        reader = csv.reader(_complete_lines(path))
+        header = next(reader, None) or []
+        chunk = []
+        for row_number, values in enumerate(reader, start=1):
+            values = align_row(header, values, fields, defaults)
+            if is_read is not None and row_number in read_ids:
+                values[is_read] = 'True'
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                _write_chunk(output, writer, fields, chunk)
+                progress.advance(len(chunk))
+                chunk = []
+        if chunk:
+            _write_chunk(output, writer, fields, chunk)
+            progress.advance(len(chunk))
+    progress.finish()
+    return progress.rows
+
+
+def _write_chunk(output, writer, fields, chunk):
+    if writer is not None:
+        writer.writerows(chunk)
+    else:
+        output.write(''.join(json.dumps(dict(zip(fields, values)), ensure_ascii=False) + '\n' for values in chunk))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import/export for Connections Airport App data files')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    for command, help_text, file_help in [('import', 'append a CSV/JSONL dump to a data file', 'dump to read, or - for stdin'),
+                                          ('export', 'write a data file out as CSV/JSONL', 'dump to write, or - for stdout')]:
+        subcommand = subcommands.add_parser(command, help=help_text)
+        subcommand.add_argument('table', choices=sorted(TABLES))
+        subcommand.add_argument('file', help=file_help)
+        subcommand.add_argument('--format', choices=['csv', 'jsonl'], help='dump format (default: from the file extension)')
+        subcommand.add_argument('--data-dir', default='.', help='directory holding the app data files')
+        subcommand.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per write')
+        subcommand.add_argument('--quiet', action='store_true', help='no progress output')
+        if command == 'import':
+            subcommand.add_argument('--skip-invalid', action='store_true', help='skip records that fail validation instead of stopping')
+    args = parser.parse_args()
+
+    progress = Progress(args.table, enabled=not args.quiet)
+    if args.command == 'import':
+        # Creates missing files and upgrades old layouts, exactly as app startup does
+        prepare_data_files(args.data_dir)
+        try:
+            rows, skipped = import_table(args.table, args.file, args.data_dir, args.format, args.chunk_size, args.skip_invalid, progress)
+        except InvalidRecord as e:
+            if progress.rows:
+                progress.finish()
+            sys.exit('❌ %s: %s (%s rows imported before it)' % (args.file, e, format(progress.rows, ',')))
+        print('✅ Imported %s %s%s' % (format(rows, ','), args.table, ' (%s invalid skipped)' % format(skipped, ',') if skipped else ''),
+              file=sys.stderr)
+    else:
+        rows = export_table(args.table, args.file, args.data_dir, args.format, args.chunk_size, progress)
+        print('✅ Exported %s %s' % (format(rows, ','), args.table), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
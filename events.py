@@ -0,0 +1,177 @@
+"""
+Server-Sent Events hub pushing flight status changes and new messages to browsers
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+STREAM_HEADERS = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/event-stream\r\n'
+    b'Cache-Control: no-cache\r\n'
+    b'Connection: keep-alive\r\n'
+    b'Access-Control-Allow-Origin: *\r\n'
+    b'\r\n'
+    b'retry: 5000\n\n'
+)
+NOT_FOUND = b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+
+class EventHub:
+    """Fan-out hub serving /events?user=<name> from a single asyncio loop
+
+    WSGI workers would tie up one thread per open stream, so the hub runs its
+    own small HTTP listener on a background event loop instead: each idle
+    client costs one coroutine and one bounded queue. Under serve.py the hub
+    lives in the master process and forked workers relay their publishes to
+    it over a Unix datagram socket.
+    """
+
+    def __init__(self, keepalive=20, queue_size=100, header_timeout=10):
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.header_timeout = header_timeout
+        self._loop = None
+        self._clients = set()
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._available = False
+        self._relay_path = None
+        self._relay_socket = None
+
+    def ensure_started(self, host, port, relay_path=None):
+        """Start the listener once per process; False if it could not bind
+
+        With relay_path the hub also accepts events published by other
+        processes through relay_to(relay_path).
+        """
+        if self._relay_path is not None:
+            return True
+        if self._pid == os.getpid():
+            return self._available
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._available
+            self._pid = os.getpid()
+            self._loop = None
+            self._clients, self._by_user = set(), {}
+            ready = threading.Event()
+            threading.Thread(target=self._serve, args=(host, port, relay_path, ready), name='event-hub', daemon=True).start()
+            ready.wait()
+            return self._available
+
+    def relay_to(self, relay_path):
+        """Send this process's events to the hub listening on relay_path instead of serving streams"""
+        self._relay_path = relay_path
+        self._relay_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._loop = None
+
+    def _serve(self, host, port, relay_path, ready):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+            if relay_path is not None:
+                relay = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                relay.bind(relay_path)
+                loop.run_until_complete(loop.create_datagram_endpoint(lambda: _RelayProtocol(self), sock=relay))
+        except OSError as e:
+            print('Event hub disabled: could not listen on %s:%s (%s)' % (host, port, e))
+            ready.set()
+            return
+        self._loop = loop
+        self._available = True
+        ready.set()
+        loop.run_forever()
+
+    def publish(self, event, data, user=None):
+        """Queue an event for one user's streams, or for every stream when user is None"""
+        if self._relay_path is not None:
+            try:
+                self._relay_socket.sendto(json.dumps([event, data, user]).encode(), self._relay_path)
+            except OSError:
+                # Live updates are best effort; clients fall back to polling
+                pass
+            return
+        loop = self._loop
+        if loop is None:
+            return
+        payload = ('event: %s\ndata: %s\n\n' % (event, json.dumps(data))).encode()
+        loop.call_soon_threadsafe(self._fan_out, payload, user)
+
+    def _fan_out(self, payload, user):
+        targets = self._clients if user is None else self._by_user.get(user, ())
+        for queue in list(targets):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # A client this far behind has gone away or cannot keep up
+                pass
+
+    async def _read_target(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), self.header_timeout)
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.header_timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        return method, urlsplit(target)
+
+    async def _handle(self, reader, writer):
+        queue = None
+        user = ''
+        try:
+            method, url = await self._read_target(reader)
+            if method != 'GET' or url.path != '/events':
+                writer.write(NOT_FOUND)
+                return
+            user = parse_qs(url.query).get('user', [''])[0]
+            queue = asyncio.Queue(self.queue_size)
+            self._clients.add(queue)
+            if user:
+                self._by_user.setdefault(user, set()).add(queue)
+            writer.write(STREAM_HEADERS)
+            await writer.drain()
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    payload = b': keepalive\n\n'
+                writer.write(payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError, ValueError):
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            if queue is not None:
+                self._clients.discard(queue)
+                subscribers = self._by_user.get(user)
+                if subscribers is not None:
+                    subscribers.discard(queue)
+                    if not subscribers:
+                        del self._by_user[user]
+            writer.close()
+
+    def stats(self):
+        return {'connections': len(self._clients), 'users': len(self._by_user)}
+
+
+class _RelayProtocol(asyncio.DatagramProtocol):
+    """Receives [event, data, user] datagrams from worker processes"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def datagram_received(self, datagram, address):
+        try:
+            event, data, user = json.loads(datagram)
+        except ValueError:
+            return
+        payload = ('event: %s\ndata: %s\n\n' % (event, json.dumps(data))).encode()
+        self.hub._fan_out(payload, user)
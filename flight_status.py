@@ -0,0 +1,137 @@
+"""
+Flight status providers and a per-flight TTL cache refreshed in the background
+"""
+
+import hashlib
+import importlib
+import os
+import threading
+import time
+import traceback
+
+FLIGHT_STATUSES = ['On Time', 'Delayed 15 min', 'Delayed 30 min', 'Boarding', 'Departed']
+PENDING_STATUS = 'Checking status...'
+
+
+class FlightStatusProvider:
+    """Source of flight statuses; subclass this to plug in a real data feed"""
+
+    def fetch(self, flight_number):
+        raise NotImplementedError
+
+    def fetch_many(self, flight_numbers):
+        """Statuses for several flights; override when the feed supports batch lookups"""
+        return {flight_number: self.fetch(flight_number) for flight_number in flight_numbers}
+
+
+class SimulatedFlightStatusProvider(FlightStatusProvider):
+    """Local stand-in that gives every flight a stable status for each period"""
+
+    def __init__(self, period=300, clock=time.time):
+        self.period = period
+        self.clock = clock
+
+    def fetch(self, flight_number):
+        window = int(self.clock() // self.period)
+        digest = hashlib.sha256(('%s:%d' % (flight_number, window)).encode()).digest()
+        return FLIGHT_STATUSES[digest[0] % len(FLIGHT_STATUSES)]
+
+
+def load_provider(spec):
+    """Instantiate a provider from a 'module:ClassName' string"""
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class FlightStatusCache:
+    """Per-flight TTL cache whose lookups never call the provider
+
+    Missing or expired flights are queued for the refresher thread, which also
+    keeps the flights returned by flights_fn (the ones on screen) fresh and
+    calls on_change(flight_number, status) whenever a status changes.
+    """
+
+    def __init__(self, provider, flights_fn=lambda: (), on_change=None, ttl=60, refresh_interval=10, max_age=3600):
+        self.provider = provider
+        self.flights_fn = flights_fn
+        self.on_change = on_change
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._entries = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def get(self, flight_number):
+        """Cached status for a flight, or PENDING_STATUS until the first fetch lands"""
+        self._ensure_running()
+        entry = self._entries.get(flight_number)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            with self._lock:
+                self._pending.add(flight_number)
+            self._wakeup.set()
+        return entry[0] if entry else PENDING_STATUS
+
+    def get_many(self, flight_numbers):
+        return {flight_number: self.get(flight_number) for flight_number in flight_numbers}
+
+    def refresh(self, flight_numbers):
+        """Fetch statuses from the provider and store them"""
+        flight_numbers = list(flight_numbers)
+        if not flight_numbers:
+            return
+        statuses = self.provider.fetch_many(flight_numbers)
+        fetched_at = time.monotonic()
+        changed = []
+        with self._lock:
+            for flight_number, status in statuses.items():
+                previous = self._entries.get(flight_number)
+                if previous is None or previous[0] != status:
+                    changed.append((flight_number, status))
+                self._entries[flight_number] = (status, fetched_at)
+        if self.on_change is not None:
+            for flight_number, status in changed:
+                self.on_change(flight_number, status)
+
+    def _due_flights(self):
+        now = time.monotonic()
+        with self._lock:
+            due = self._pending
+            self._pending = set()
+            # Drop flights nobody has asked about for a long time
+            for flight_number in [f for f, (_, fetched_at) in self._entries.items() if now - fetched_at > self.max_age]:
+                del self._entries[flight_number]
+        # Refresh on-screen flights shortly before they expire
+        horizon = self.ttl - self.refresh_interval
+        for flight_number in self.flights_fn():
+            entry = self._entries.get(flight_number)
+            if entry is None or now - entry[1] >= horizon:
+                due.add(flight_number)
+        return due
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            try:
+                self.refresh(self._due_flights())
+            except Exception:
+                traceback.print_exc()
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='flight-status-refresher', daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {'flights': len(self._entries), 'pending': len(self._pending)}
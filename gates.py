@@ -0,0 +1,164 @@
+"""
+Walking distances between gates, and travelers sorted by how far away they are
+
+Each airport's gate graph is a JSON file in the gate maps directory, named
+after the airport code the check-in form uses (SFO.json):
+
+  {"gates": ["A1", "A2", "B1"], "walkways": [["A1", "A2", 120], ["A2", "B1", 450]]}
+
+Walkways are walkable both ways and measured in meters. On load every
+pair's shortest walking distance is computed once into a float32 matrix.
+Each airport's travelers are also kept as an array of gate positions until
+its profiles change, so finding the travelers nearest a gate is one row
+lookup and a partial sort.
+"""
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# Meters per minute at an unhurried walk
+WALKING_SPEED = 80.0
+
+_AIRPORT_CODE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def normalize_gate(gate):
+    """Gate names compare without case or spaces: ' b 12' is B12"""
+    return ''.join((gate or '').split()).upper()
+
+
+def all_pairs_distances(size, walkways):
+    """Floyd-Warshall over (from, to, meters) edges; unreachable pairs stay inf"""
+    distances = np.full((size, size), np.inf)
+    np.fill_diagonal(distances, 0.0)
+    for start, end, meters in walkways:
+        if meters < distances[start, end]:
+            distances[start, end] = distances[end, start] = meters
+    for via in range(size):
+        np.minimum(distances, distances[:, via, None] + distances[None, via, :], out=distances)
+    return distances
+
+
+class GateMap:
+    """All-pairs walking distances for one airport's gates
+
+    The matrix has one extra row and column of inf for gates the map does
+    not know, so unknown gates need no special case when indexing.
+    """
+
+    def __init__(self, airport, gates, walkways):
+        self.airport = airport
+        self.gates = [normalize_gate(gate) for gate in gates]
+        self.index = {}
+        for position, gate in enumerate(self.gates):
+            if not gate or gate in self.index:
+                raise ValueError('%s: gate %r is empty or listed twice' % (airport, gate))
+            self.index[gate] = position
+        edges = []
+        for walkway in walkways:
+            start, end, meters = walkway
+            if normalize_gate(start) not in self.index or normalize_gate(end) not in self.index:
+                raise ValueError('%s: walkway %r joins an unknown gate' % (airport, walkway))
+            if not meters >= 0:
+                raise ValueError('%s: walkway %r has a negative length' % (airport, walkway))
+            edges.append((self.index[normalize_gate(start)], self.index[normalize_gate(end)], float(meters)))
+        self.unknown = len(self.gates)
+        self.distances = np.full((self.unknown + 1, self.unknown + 1), np.inf, dtype=np.float32)
+        self.distances[:-1, :-1] = all_pairs_distances(self.unknown, edges)
+
+    @classmethod
+    def load(cls, path, airport):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls(airport, data.get('gates', []), data.get('walkways', []))
+
+    def gate_index(self, gate):
+        return self.index.get(normalize_gate(gate), self.unknown)
+
+    def distance(self, from_gate, to_gate):
+        """Walking meters between two gates; inf if either is unknown or they are not connected"""
+        return float(self.distances[self.gate_index(from_gate), self.gate_index(to_gate)])
+
+
+class GateCandidates:
+    """Gate positions of one airport's visible profiles, in store order"""
+
+    def __init__(self, rows, gate_map):
+        self.rows = rows
+        self.gates = np.fromiter((gate_map.gate_index(row.get('Gate')) for row in rows), dtype=np.int32, count=len(rows))
+        # Someone who checked in more than once is placed at their latest gate only
+        self.latest_by_name = {}
+        for position, row in enumerate(rows):
+            self.latest_by_name[row.get('Name')] = position
+        self.is_latest = np.zeros(len(rows), dtype=bool)
+        self.is_latest[list(self.latest_by_name.values())] = True
+
+
+class GateMaps:
+    """Gate maps loaded on demand from a directory, reloaded when a file changes"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}
+        self._candidates = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, airport):
+        """The airport's GateMap, or None without a map file for it"""
+        if not airport or not _AIRPORT_CODE.match(airport):
+            return None
+        path = os.path.join(self.directory, airport + '.json')
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        cached = self._maps.get(airport)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        # Computing the table takes a moment for a big hub; do it once even if requests race
+        with self._lock:
+            cached = self._maps.get(airport)
+            if cached is None or cached[0] != signature:
+                cached = self._maps[airport] = (signature, GateMap.load(path, airport))
+        return cached[1]
+
+    def candidates(self, gate_map, version, load_rows):
+        """Gate positions of the airport's travelers; load_rows() is only called when version changed"""
+        key = (id(gate_map), version)
+        cached = self._candidates.get(gate_map.airport)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        candidates = GateCandidates(load_rows(), gate_map)
+        self._candidates[gate_map.airport] = (key, candidates)
+        return candidates
+
+    def nearby(self, traveler, gate_map, version, load_rows, k=10):
+        """Up to k (row, meters) pairs for the travelers closest to traveler's gate, nearest first
+
+        version identifies the airport's visible profiles and load_rows()
+        returns them; see candidates().
+        """
+        candidates = self.candidates(gate_map, version, load_rows)
+        if not candidates.rows or k <= 0:
+            return []
+        distances = gate_map.distances[gate_map.gate_index(traveler.get('Gate')), candidates.gates]
+        distances[~candidates.is_latest] = np.inf
+        me = candidates.latest_by_name.get(traveler.get('Name'))
+        if me is not None:
+            distances[me] = np.inf
+        k = min(k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return [(candidates.rows[i], float(distances[i])) for i in nearest if distances[i] != np.inf]
+
+    def stats(self):
+        return {'airports': sorted(self._maps), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,110 @@
+"""
+Conditional GET and cached compressed bodies for pages that only change with the data
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 8
+
+
+def version_tag(*parts):
+    """Short stable tag for a data version and whatever else shapes the page"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def negotiate_encoding(accept_encodings):
+    """Best encoding the client accepts: 'br', 'gzip' or None for identity"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+class CachedPage:
+    """One rendered page and its encodings, each compressed at most once"""
+
+    def __init__(self, body):
+        self.body = body
+        self._encoded = {None: body}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        if encoding is None or len(self.body) < MIN_COMPRESS_SIZE:
+            return None, self.body
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'br':
+                    self._encoded[encoding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            return encoding, self._encoded[encoding]
+
+
+class PageCache:
+    """Least-recently-used pages keyed by version tag"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get_or_render(self, tag, render):
+        with self._lock:
+            page = self._pages.get(tag)
+            if page is not None:
+                self._pages.move_to_end(tag)
+                self.hits += 1
+                return page
+        # Render outside the lock; a concurrent render of the same version is harmless
+        page = CachedPage(render().encode('utf-8'))
+        with self._lock:
+            self.misses += 1
+            self._pages[tag] = page
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+    def response(self, tag, modified_at, render, mimetype='text/html'):
+        """304 when the client's copy is current, otherwise the cached page in its best encoding"""
+        encoding = negotiate_encoding(request.accept_encodings)
+        last_modified = datetime.fromtimestamp(int(modified_at), timezone.utc)
+        if request.if_none_match:
+            current = request.if_none_match.contains_weak(tag)
+        else:
+            current = request.if_modified_since is not None and last_modified <= request.if_modified_since
+        if current:
+            self.not_modified += 1
+            response = Response(status=304)
+        else:
+            encoding, body = self.get_or_render(tag, render).encoded(encoding)
+            response = Response(body, mimetype=mimetype)
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        # Every encoding shares the tag as a weak validator, since they carry the same content
+        response.set_etag(tag, weak=True)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'pages': len(self._pages), 'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
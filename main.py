@@ -1,9 +1,19 @@
-from flask import Flask, render_template_string, request, session, jsonify, redirect, url_for
-import csv
+from flask import Flask, render_template, request, session, jsonify, redirect, url_for, abort
+import hashlib
+import mimetypes
 import os
 from datetime import datetime, timedelta
 import random
 import json
+from json.encoder import encode_basestring
+from stores import PeriodicTask, RetentionPolicy
+from storage import PROFILE_FIELDS, VERIFIED, CsvStorage, SqliteStorage
+from flight_status import FlightStatusCache, SimulatedFlightStatusProvider, load_provider
+from events import EventHub
+from matching import MatchRanker
+from gates import WALKING_SPEED, GateMaps
+from http_cache import PageCache, version_tag
+from metrics import RequestMetrics, SlowRequestSampler, registry, timed_stage
 print("main.py is running!")
 
 app = Flask(__name__)
@@ -13,6 +23,74 @@ app.secret_key = 'connections_airport_app_secret_key'
 PROFILES_FILE = 'airport_profiles.csv'
 MESSAGES_FILE = 'messages.csv'
 VERIFICATIONS_FILE = 'verifications.csv'
+READ_RECEIPTS_FILE = 'read_receipts.csv'
+PROFILES_ARCHIVE_FILE = 'airport_profiles_archive.csv'
+
+DATABASE_FILE = os.environ.get('DATABASE_FILE', 'connections.db')
+
+# Profiles are hidden an hour after departure, and a day after check-in at the latest
+PROFILE_EXPIRY_GRACE = timedelta(hours=1)
+PROFILE_MAX_AGE = timedelta(hours=24)
+profile_retention = RetentionPolicy(PROFILE_EXPIRY_GRACE, PROFILE_MAX_AGE)
+
+# Persistence backend: the CSV files (default) or SQLite via STORAGE_BACKEND=sqlite
+# (import existing CSV data first with: python storage.py migrate-csv)
+if os.environ.get('STORAGE_BACKEND', 'csv') == 'sqlite':
+    storage = SqliteStorage(DATABASE_FILE, retention=profile_retention)
+else:
+    storage = CsvStorage(PROFILES_FILE, MESSAGES_FILE, VERIFICATIONS_FILE, READ_RECEIPTS_FILE,
+                         archive_path=PROFILES_ARCHIVE_FILE, retention=profile_retention)
+
+# Background maintenance (archiving expired profiles, plus read-receipt compaction
+# for CSV and WAL checkpoints for SQLite)
+MAINTENANCE_INTERVAL = 300
+storage_maintenance = PeriodicTask('storage-maintenance', MAINTENANCE_INTERVAL, storage.compact)
+
+# Message history pagination
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Traveler feed pagination
+FEED_PAGE_SIZE = 24
+MAX_FEED_PAGE_SIZE = 100
+
+# Fields /api/profiles returns unless the client projects with fields=
+API_PROFILE_FIELDS = ['Name', 'Airport', 'Terminal', 'Gate', 'Flight_Number', 'Departure_Time', 'Destination', 'Travel_Purpose', 'Interests', 'Points', 'Is_Verified']
+
+# Server-Sent Events listener (see events.py); EVENTS_URL overrides the public address
+EVENTS_PORT = int(os.environ.get('EVENTS_PORT', int(os.environ.get('PORT', 5001)) + 1))
+EVENTS_URL = os.environ.get('EVENTS_URL')
+event_hub = EventHub()
+
+# Request and stage timings at /metrics; set SLOW_REQUEST_MS to also sample the
+# stacks of requests slower than that (listed at /metrics/slow)
+SLOW_REQUEST_MS = os.environ.get('SLOW_REQUEST_MS')
+request_metrics = RequestMetrics(SlowRequestSampler(float(SLOW_REQUEST_MS) / 1000) if SLOW_REQUEST_MS else None)
+request_metrics.init_app(app)
+
+# Rendered index pages per data version, with their compressed encodings
+index_pages = PageCache()
+
+# Match ranking (see matching.py)
+MATCH_COUNT = 10
+MAX_MATCH_COUNT = 100
+match_ranker = MatchRanker()
+
+# Gate-to-gate walking distances, one <AIRPORT>.json per airport (see gates.py)
+GATE_MAPS_DIR = os.environ.get('GATE_MAPS_DIR', 'gate_maps')
+gate_maps = GateMaps(GATE_MAPS_DIR)
+
+# Results per /search request, by default and at most (see search.py)
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Largest number of distinct flights accepted by one /flight_statuses call (STATUS_BATCH_SIZE in static/app.js)
+MAX_STATUS_BATCH = 500
+
+# Static assets are served under a content-hash name so browsers can cache them indefinitely
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSET_FILES = ['app.css', 'app.js']
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
 
 # Icebreaker prompts
 ICEBREAKERS = [
@@ -28,118 +106,281 @@ ICEBREAKERS = [
     "What's your go-to travel playlist?"
 ]
 
-# Create CSV files with headers if they don't exist
+# Create CSV files (or database tables) if they don't exist and migrate older data
 def init_csv():
-    if not os.path.exists(PROFILES_FILE):
-        with open(PROFILES_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Name', 'Age', 'Bio', 'Airport', 'Terminal', 'Gate', 'Flight_Number', 'Departure_Time', 'Destination', 'Travel_Purpose', 'Interests', 'Icebreaker_Response', 'Points', 'Is_Visible', 'Is_Verified', 'Timestamp'])
-    
-    if not os.path.exists(MESSAGES_FILE):
-        with open(MESSAGES_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['From_Name', 'To_Name', 'Message', 'Timestamp', 'Is_Read'])
-    
-    if not os.path.exists(VERIFICATIONS_FILE):
-        with open(VERIFICATIONS_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Name', 'Verification_Type', 'Status', 'Timestamp'])
+    storage.init_schema()
 
-# Save profile to CSV file
+# Save profile
 def save_profile(name, age, bio, airport, terminal, gate, flight_number, departure_time, destination, travel_purpose, interests, icebreaker_response):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     points = 100  # Starting points
     is_visible = True
     is_verified = False
-    with open(PROFILES_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([name, age, bio, airport, terminal, gate, flight_number, departure_time, destination, travel_purpose, interests, icebreaker_response, points, is_visible, is_verified, timestamp])
+    storage.add_profile([name, age, bio, airport, terminal, gate, flight_number, departure_time, destination, travel_purpose, interests, icebreaker_response, points, is_visible, is_verified, timestamp])
+    storage_maintenance.ensure_started()
 
-# Read all profiles from CSV file
+# Read all profiles
+@timed_stage('filter')
 def get_all_profiles():
-    profiles = []
-    if os.path.exists(PROFILES_FILE):
-        with open(PROFILES_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                profiles.append(row)
-    return profiles
+    return storage.all_profiles()
 
 # Get profiles by airport and terminal (location filtering)
+@timed_stage('filter')
 def get_profiles_by_location(airport, terminal):
-    profiles = get_all_profiles()
-    return [p for p in profiles if p['Airport'] == airport and p['Terminal'] == terminal and p['Is_Visible'] == 'True']
+    return storage.profiles_by_location(airport, terminal)
 
 # Get profiles by airport only
+@timed_stage('filter')
 def get_profiles_by_airport(airport):
-    profiles = get_all_profiles()
-    return [p for p in profiles if p['Airport'] == airport and p['Is_Visible'] == 'True']
+    return storage.profiles_by_airport(airport)
+
+# Latest visible profile for a traveler (an index lookup)
+def get_traveler_profile(name, airport=None):
+    return storage.latest_profile(name, airport)
+
+# Best people at the traveler's airport for them to talk to
+def get_matches(name, airport=None, k=MATCH_COUNT):
+    traveler = get_traveler_profile(name, airport)
+    if traveler is None:
+        return None
+    k = max(1, min(k, MAX_MATCH_COUNT))
+    now = datetime.now()
+    airport = traveler['Airport']
+    # The airport's rows are only fetched when they changed since they were encoded
+    return match_ranker.rank(traveler, airport, storage.profiles_version(airport), lambda: get_profiles_by_airport(airport), now.hour * 60 + now.minute, k)
+
+# Travelers nearest a traveler's gate as (profile, walking meters), or an error message
+def get_nearby(name, airport=None, k=MATCH_COUNT):
+    traveler = get_traveler_profile(name, airport)
+    if traveler is None:
+        return None, 'No visible profile for %s' % name
+    gate_map = gate_maps.get(traveler['Airport'])
+    if gate_map is None:
+        return None, 'No gate map for %s' % traveler['Airport']
+    if gate_map.gate_index(traveler['Gate']) == gate_map.unknown:
+        return None, 'Gate %s is not on the %s gate map' % (traveler['Gate'] or '(none)', traveler['Airport'])
+    k = max(1, min(k, MAX_MATCH_COUNT))
+    airport = traveler['Airport']
+    # The airport's rows are only fetched when they changed since the gate positions were cached
+    return gate_maps.nearby(traveler, gate_map, storage.profiles_version(airport), lambda: get_profiles_by_airport(airport), k), None
+
+# Visible profiles at an airport whose bio, interests, destination or icebreaker match a text query, best first
+@timed_stage('filter')
+def search_profiles(airport, query, limit=SEARCH_LIMIT):
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    return storage.search_profiles(airport, query, limit)
+
+# One newest-first page of visible profiles, optionally narrowed to an airport/terminal
+@timed_stage('filter')
+def get_feed_page(airport=None, terminal=None, cursor=None, limit=FEED_PAGE_SIZE):
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    return storage.profile_page(airport, terminal, cursor, limit)
+
+# Render profile cards for the feed, with verified badges joined in one batch lookup
+def render_feed(checkins, first_page=True):
+    statuses = storage.verification_statuses({checkin['Name'] for checkin in checkins})
+    verified = {name for name, status in statuses.items() if status == VERIFIED}
+    return render_template(PROFILE_CARDS, checkins=checkins, verified=verified, show_empty=first_page)
+
+# JSON array of profiles written straight from the cached rows, with only the given fields
+def profiles_to_json(rows, fields):
+    keys = [encode_basestring(field) + ':' for field in fields]
+    items = []
+    for row in rows:
+        values = [row.get(field) for field in fields]
+        items.append('{' + ','.join(key + ('null' if value is None else encode_basestring(value)) for key, value in zip(keys, values)) + '}')
+    return '[' + ','.join(items) + ']'
 
 # Save message
 def save_message(from_name, to_name, message):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     is_read = False
-    with open(MESSAGES_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([from_name, to_name, message, timestamp, is_read])
+    storage.add_message([from_name, to_name, message, timestamp, is_read])
+    # The stream is readable from any origin, so the event only says a sync is due; the text stays behind /messages
+    event_hub.publish('new_message', {'timestamp': timestamp}, user=to_name)
 
 # Get messages for a user
+@timed_stage('filter')
 def get_messages_for_user(user_name):
-    messages = []
-    if os.path.exists(MESSAGES_FILE):
-        with open(MESSAGES_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row['To_Name'] == user_name or row['From_Name'] == user_name:
-                    messages.append(row)
-    return messages
-
-# Mark message as read
+    return storage.messages_for_user(user_name)
+
+# Newest messages for a user, or for one conversation when with_name is given
+@timed_stage('filter')
+def get_message_page(user_name, with_name=None, cursor=None, limit=MESSAGE_PAGE_SIZE):
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    if with_name:
+        return storage.message_page_for_conversation(user_name, with_name, cursor, limit)
+    return storage.message_page_for_user(user_name, cursor, limit)
+
+# Messages a user sent or received after the given message ID, oldest first
+@timed_stage('filter')
+def get_messages_since(user_name, after=0, limit=MESSAGE_PAGE_SIZE):
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    return storage.messages_since(user_name, after, limit)
+
+# Mark message as read (a receipt record for CSV, an indexed UPDATE for SQLite)
+@timed_stage('write')
 def mark_message_as_read(from_name, to_name, timestamp):
-    messages = []
-    if os.path.exists(MESSAGES_FILE):
-        with open(MESSAGES_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if (row['From_Name'] == from_name and row['To_Name'] == to_name and 
-                    row['Timestamp'] == timestamp):
-                    row['Is_Read'] = True
-                messages.append(row)
-        
-        # Rewrite file with updated read status
-        with open(MESSAGES_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['From_Name', 'To_Name', 'Message', 'Timestamp', 'Is_Read'])
-            for msg in messages:
-                writer.writerow([msg['From_Name'], msg['To_Name'], msg['Message'], msg['Timestamp'], msg['Is_Read']])
+    read_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    storage.mark_messages_read(from_name, to_name, timestamp, read_at)
+    storage_maintenance.ensure_started()
+
+# Unread messages for a user, optionally only those from one sender
+def get_unread_count(user_name, from_name=None):
+    return storage.unread_count(user_name, from_name)
 
 # Save verification
 def save_verification(name, verification_type):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     status = 'Pending'
-    with open(VERIFICATIONS_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([name, verification_type, status, timestamp])
+    storage.add_verification([name, verification_type, status, timestamp])
 
 # Get verification status
 def get_verification_status(name):
-    if os.path.exists(VERIFICATIONS_FILE):
-        with open(VERIFICATIONS_FILE, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row['Name'] == name:
-                    return row['Status']
-    return 'Not_Verified'
+    return storage.verification_status(name)
+
+# Load static assets into memory and fingerprint them by content
+def load_assets():
+    assets = {}
+    urls = {}
+    for filename in ASSET_FILES:
+        with open(os.path.join(STATIC_DIR, filename), 'rb') as file:
+            body = file.read()
+        stem, ext = os.path.splitext(filename)
+        fingerprinted = '%s.%s%s' % (stem, hashlib.sha256(body).hexdigest()[:12], ext)
+        assets[fingerprinted] = (body, mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        urls[filename] = '/assets/' + fingerprinted
+    return assets, urls
+
+ASSETS, ASSET_URLS = load_assets()
+
+# Address browsers use for the event stream, or None when the hub is unavailable
+def get_events_url():
+    if not event_hub.ensure_started('0.0.0.0', EVENTS_PORT):
+        return None
+    if EVENTS_URL:
+        return EVENTS_URL
+    host = request.host
+    if ':' in host and not host.endswith(']'):
+        host = host.rsplit(':', 1)[0]
+    return '//%s:%d/events' % (host, EVENTS_PORT)
+
+# URL of the current fingerprinted version of a static asset
+def asset_url(filename):
+    return ASSET_URLS[filename]
+
+# Load shared data into memory before serving (serve.py calls this before forking workers).
+# Maintenance is left to the workers: a master thread holding a store lock across a fork would hang the child
+def warm_up():
+    storage.warm_up()
+
+# Tag and modification time of everything the public index page shows
+def get_index_version(airport=None, terminal=None):
+    version, modified_at = storage.feed_version()
+    return version_tag(version, airport, terminal, sorted(ASSET_URLS.items()), get_events_url()), modified_at
 
 # Get random icebreaker
 def get_random_icebreaker():
     return random.choice(ICEBREAKERS)
 
-# Simulate flight status updates
+# Flight numbers of every visible profile, kept warm by the status refresher
+def get_visible_flight_numbers():
+    return {p['Flight_Number'] for p in storage.visible_profiles() if p.get('Flight_Number')}
+
+# Flight statuses come from a pluggable provider (FLIGHT_STATUS_PROVIDER='module:Class')
+# through a TTL cache that a background thread keeps fresh
+if os.environ.get('FLIGHT_STATUS_PROVIDER'):
+    flight_status_provider = load_provider(os.environ['FLIGHT_STATUS_PROVIDER'])
+else:
+    flight_status_provider = SimulatedFlightStatusProvider()
+flight_status_cache = FlightStatusCache(flight_status_provider,
+                                        flights_fn=get_visible_flight_numbers,
+                                        on_change=lambda flight, status: event_hub.publish('flight_status', {'flight': flight, 'status': status}))
+
+# Cached flight status; never waits on the provider
 def get_flight_status(flight_number):
-    # Simulate real-time flight status
-    statuses = ['On Time', 'Delayed 15 min', 'Delayed 30 min', 'Boarding', 'Departed']
-    return random.choice(statuses)
+    return flight_status_cache.get(flight_number)
+
+PROFILE_CARDS_TEMPLATE = '''
+{% if checkins %}
+    {% for checkin in checkins %}
+    <div class="profile-card" data-airport="{{ checkin.Airport }}" data-terminal="{{ checkin.Terminal }}">
+        {% if checkin.Is_Verified == 'True' or checkin.Name in verified %}
+        <div class="verification-badge">
+            <i class="fas fa-check-circle"></i> Verified
+        </div>
+        {% endif %}
+        
+        <div class="points-badge">
+            <i class="fas fa-star"></i> {{ checkin.Points }} pts
+        </div>
+        
+        <div class="profile-header">
+            <div class="profile-avatar">
+                {{ checkin.Name[0] if checkin.Name else 'U' }}
+            </div>
+            <div class="profile-info">
+                <h3>{{ checkin.Name }}</h3>
+                <p><i class="fas fa-map-marker-alt"></i> {{ checkin.Airport }} - {{ checkin.Terminal }}</p>
+                <p><i class="fas fa-birthday-cake"></i> {{ checkin.Age }} years old</p>
+            </div>
+        </div>
+        
+        <div class="flight-info">
+            <h4><i class="fas fa-plane"></i> Flight Details</h4>
+            <div class="flight-details">
+                <div><strong>Flight:</strong> {{ checkin.Flight_Number }}</div>
+                <div><strong>Departure:</strong> {{ checkin.Departure_Time }}</div>
+                <div><strong>Destination:</strong> {{ checkin.Destination }}</div>
+                <div><strong>Purpose:</strong> {{ checkin.Travel_Purpose }}</div>
+            </div>
+            <div class="flight-status" data-flight="{{ checkin.Flight_Number }}">
+                <i class="fas fa-clock"></i> Checking status...
+            </div>
+        </div>
+        
+        <div class="profile-bio">
+            "{{ checkin.Bio }}"
+        </div>
+        
+        {% if checkin.Icebreaker_Response %}
+        <div class="icebreaker-response">
+            <strong>💬 Icebreaker:</strong> {{ checkin.Icebreaker_Response }}
+        </div>
+        {% endif %}
+        
+        {% if checkin.Interests %}
+        <div class="profile-interests">
+            {% for interest in checkin.Interests.split(', ') %}
+            <span class="interest-tag">{{ interest }}</span>
+            {% endfor %}
+        </div>
+        {% endif %}
+        
+        <div class="action-buttons">
+            <button class="btn btn-primary" onclick="sendMessage('{{ checkin.Name }}')">
+                <i class="fas fa-comment"></i> Message
+            </button>
+            <button class="btn btn-secondary" onclick="viewProfile('{{ checkin.Name }}')">
+                <i class="fas fa-eye"></i> View Profile
+            </button>
+        </div>
+        
+        <div class="profile-timestamp">
+            <i class="fas fa-clock"></i> Joined {{ checkin.Timestamp }}
+        </div>
+    </div>
+    {% endfor %}
+{% elif show_empty %}
+    <div class="profile-card" style="text-align: center; grid-column: 1 / -1;">
+        <div class="success-icon" style="color: #667eea;">
+            <i class="fas fa-users"></i>
+        </div>
+        <h3 style="margin-bottom: 10px;">No travelers yet</h3>
+        <p style="color: #666;">Be the first to create a profile and start connecting with fellow travelers!</p>
+    </div>
+{% endif %}
+'''
 
 TEMPLATE = '''
 <!DOCTYPE html>
@@ -149,533 +390,9 @@ TEMPLATE = '''
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap" rel="stylesheet">
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Inter', sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            color: #333;
-        }
-        
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        
-        .header {
-            text-align: center;
-            margin-bottom: 40px;
-            color: white;
-        }
-        
-        .header h1 {
-            font-size: 3rem;
-            font-weight: 700;
-            margin-bottom: 10px;
-            text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-        }
-        
-        .header p {
-            font-size: 1.2rem;
-            opacity: 0.9;
-            font-weight: 300;
-            margin-bottom: 20px;
-        }
-        
-        .tagline {
-            background: rgba(255,255,255,0.2);
-            padding: 10px 20px;
-            border-radius: 25px;
-            display: inline-block;
-            font-size: 1rem;
-            font-weight: 500;
-        }
-        
-        .nav-tabs {
-            display: flex;
-            justify-content: center;
-            margin-bottom: 30px;
-            background: rgba(255,255,255,0.1);
-            border-radius: 15px;
-            padding: 5px;
-        }
-        
-        .nav-tab {
-            padding: 12px 24px;
-            color: white;
-            text-decoration: none;
-            border-radius: 10px;
-            transition: all 0.3s ease;
-            margin: 0 5px;
-        }
-        
-        .nav-tab.active {
-            background: rgba(255,255,255,0.2);
-            font-weight: 600;
-        }
-        
-        .nav-tab:hover {
-            background: rgba(255,255,255,0.15);
-        }
-        
-        .main-content {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 40px;
-            align-items: start;
-        }
-        
-        .profile-form {
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            backdrop-filter: blur(10px);
-        }
-        
-        .form-title {
-            font-size: 1.8rem;
-            font-weight: 600;
-            margin-bottom: 30px;
-            color: #333;
-            text-align: center;
-        }
-        
-        .form-group {
-            margin-bottom: 25px;
-        }
-        
-        label {
-            display: block;
-            margin-bottom: 8px;
-            font-weight: 500;
-            color: #555;
-            font-size: 0.95rem;
-        }
-        
-        input[type="text"], input[type="number"], select, textarea {
-            width: 100%;
-            padding: 15px;
-            border: 2px solid #e1e5e9;
-            border-radius: 12px;
-            font-size: 1rem;
-            transition: all 0.3s ease;
-            background: #f8f9fa;
-        }
-        
-        input[type="text"]:focus, input[type="number"]:focus, select:focus, textarea:focus {
-            outline: none;
-            border-color: #667eea;
-            background: white;
-            box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-        }
-        
-        textarea {
-            resize: vertical;
-            min-height: 100px;
-        }
-        
-        .interests-grid {
-            display: grid;
-            grid-template-columns: repeat(2, 1fr);
-            gap: 10px;
-            margin-top: 10px;
-        }
-        
-        .interest-option {
-            display: flex;
-            align-items: center;
-            padding: 10px;
-            border: 2px solid #e1e5e9;
-            border-radius: 8px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
-        
-        .interest-option:hover {
-            border-color: #667eea;
-            background: #f0f2ff;
-        }
-        
-        .interest-option input[type="checkbox"] {
-            margin-right: 8px;
-            transform: scale(1.2);
-        }
-        
-        .submit-btn {
-            width: 100%;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 16px;
-            border: none;
-            border-radius: 12px;
-            font-size: 1.1rem;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            margin-top: 20px;
-        }
-        
-        .submit-btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 10px 20px rgba(102, 126, 234, 0.3);
-        }
-        
-        .success-card {
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        
-        .success-icon {
-            font-size: 4rem;
-            color: #4CAF50;
-            margin-bottom: 20px;
-        }
-        
-        .success-title {
-            font-size: 2rem;
-            font-weight: 600;
-            margin-bottom: 15px;
-            color: #333;
-        }
-        
-        .success-text {
-            font-size: 1.1rem;
-            color: #666;
-            margin-bottom: 25px;
-        }
-        
-        .profile-card {
-            background: white;
-            border-radius: 20px;
-            padding: 30px;
-            margin-bottom: 20px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-            transition: transform 0.3s ease;
-            position: relative;
-        }
-        
-        .profile-card:hover {
-            transform: translateY(-5px);
-        }
-        
-        .profile-header {
-            display: flex;
-            align-items: center;
-            margin-bottom: 15px;
-        }
-        
-        .profile-avatar {
-            width: 60px;
-            height: 60px;
-            border-radius: 50%;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: white;
-            font-size: 1.5rem;
-            font-weight: 600;
-            margin-right: 15px;
-        }
-        
-        .profile-info h3 {
-            font-size: 1.3rem;
-            font-weight: 600;
-            margin-bottom: 5px;
-            color: #333;
-        }
-        
-        .profile-info p {
-            color: #666;
-            font-size: 0.95rem;
-        }
-        
-        .flight-info {
-            background: #f8f9fa;
-            padding: 15px;
-            border-radius: 12px;
-            margin: 15px 0;
-            border-left: 4px solid #667eea;
-        }
-        
-        .flight-info h4 {
-            color: #333;
-            margin-bottom: 8px;
-            font-size: 1rem;
-        }
-        
-        .flight-details {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 10px;
-            font-size: 0.9rem;
-            color: #666;
-        }
-        
-        .flight-status {
-            background: #e8f5e8;
-            color: #2d5a2d;
-            padding: 8px 12px;
-            border-radius: 8px;
-            font-size: 0.85rem;
-            font-weight: 600;
-            margin-top: 10px;
-            display: inline-block;
-        }
-        
-        .profile-bio {
-            color: #555;
-            line-height: 1.6;
-            margin-bottom: 15px;
-        }
-        
-        .icebreaker-response {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 15px;
-            border-radius: 12px;
-            margin: 15px 0;
-            font-style: italic;
-        }
-        
-        .profile-interests {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 8px;
-            margin: 15px 0;
-        }
-        
-        .interest-tag {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 6px 12px;
-            border-radius: 20px;
-            font-size: 0.85rem;
-            font-weight: 500;
-        }
-        
-        .profile-timestamp {
-            color: #999;
-            font-size: 0.85rem;
-            margin-top: 15px;
-        }
-        
-        .points-badge {
-            position: absolute;
-            top: 15px;
-            right: 15px;
-            background: #ffd700;
-            color: #333;
-            padding: 5px 10px;
-            border-radius: 15px;
-            font-size: 0.8rem;
-            font-weight: 600;
-        }
-        
-        .verification-badge {
-            position: absolute;
-            top: 15px;
-            left: 15px;
-            background: #4CAF50;
-            color: white;
-            padding: 5px 10px;
-            border-radius: 15px;
-            font-size: 0.8rem;
-            font-weight: 600;
-        }
-        
-        .action-buttons {
-            display: flex;
-            gap: 10px;
-            margin-top: 15px;
-        }
-        
-        .btn {
-            padding: 8px 16px;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 0.9rem;
-            font-weight: 500;
-            transition: all 0.3s ease;
-            text-decoration: none;
-            display: inline-block;
-        }
-        
-        .btn-primary {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-        }
-        
-        .btn-secondary {
-            background: #f8f9fa;
-            color: #666;
-            border: 1px solid #e1e5e9;
-        }
-        
-        .btn:hover {
-            transform: translateY(-1px);
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        }
-        
-        .section-title {
-            color: white;
-            font-size: 2rem;
-            font-weight: 600;
-            margin-bottom: 30px;
-            text-align: center;
-        }
-        
-        .new-profile-btn {
-            display: inline-block;
-            background: rgba(255,255,255,0.2);
-            color: white;
-            padding: 12px 24px;
-            border-radius: 25px;
-            text-decoration: none;
-            font-weight: 500;
-            transition: all 0.3s ease;
-            border: 2px solid rgba(255,255,255,0.3);
-        }
-        
-        .new-profile-btn:hover {
-            background: rgba(255,255,255,0.3);
-            transform: translateY(-2px);
-        }
-        
-        .safety-notice {
-            background: rgba(255,255,255,0.1);
-            border: 1px solid rgba(255,255,255,0.3);
-            padding: 15px;
-            border-radius: 12px;
-            margin: 20px 0;
-            color: white;
-            font-size: 0.9rem;
-        }
-        
-        .safety-notice h4 {
-            margin-bottom: 8px;
-            font-size: 1rem;
-        }
-        
-        .filter-section {
-            background: rgba(255,255,255,0.1);
-            padding: 20px;
-            border-radius: 15px;
-            margin-bottom: 30px;
-            color: white;
-        }
-        
-        .filter-section h3 {
-            margin-bottom: 15px;
-            font-size: 1.2rem;
-        }
-        
-        .filter-options {
-            display: flex;
-            gap: 15px;
-            flex-wrap: wrap;
-        }
-        
-        .filter-option {
-            background: rgba(255,255,255,0.2);
-            padding: 8px 16px;
-            border-radius: 20px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            border: 1px solid rgba(255,255,255,0.3);
-        }
-        
-        .filter-option.active {
-            background: rgba(255,255,255,0.3);
-            font-weight: 600;
-        }
-        
-        .messages-section {
-            background: white;
-            border-radius: 20px;
-            padding: 30px;
-            margin-bottom: 30px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-        }
-        
-        .message-item {
-            border-bottom: 1px solid #e1e5e9;
-            padding: 15px 0;
-        }
-        
-        .message-header {
-            display: flex;
-            justify-content: space-between;
-            margin-bottom: 8px;
-        }
-        
-        .message-sender {
-            font-weight: 600;
-            color: #333;
-        }
-        
-        .message-time {
-            color: #999;
-            font-size: 0.85rem;
-        }
-        
-        .message-content {
-            color: #555;
-            line-height: 1.5;
-        }
-        
-        .unread {
-            background: #f0f2ff;
-            border-left: 4px solid #667eea;
-            padding-left: 15px;
-        }
-        
-        @media (max-width: 768px) {
-            .main-content {
-                grid-template-columns: 1fr;
-                gap: 30px;
-            }
-            
-            .header h1 {
-                font-size: 2.5rem;
-            }
-            
-            .profile-form {
-                padding: 30px 20px;
-            }
-            
-            .interests-grid {
-                grid-template-columns: 1fr;
-            }
-            
-            .flight-details {
-                grid-template-columns: 1fr;
-            }
-            
-            .filter-options {
-                flex-direction: column;
-            }
-            
-            .action-buttons {
-                flex-direction: column;
-            }
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('app.css') }}">
 </head>
-<body>
+<body data-events-url="{{ events_url or '' }}" data-user="{{ name or '' }}">
     <div class="container">
         <div class="header">
             <h1><i class="fas fa-plane"></i> Connections ✈️</h1>
@@ -691,6 +408,7 @@ TEMPLATE = '''
             </a>
             <a href="#messages" class="nav-tab" onclick="showSection('messages')">
                 <i class="fas fa-comments"></i> Messages
+                <span id="unread-badge" class="unread-badge"{% if not unread %} style="display: none;"{% endif %}>{{ unread }}</span>
             </a>
             <a href="#create" class="nav-tab" onclick="showSection('create')">
                 <i class="fas fa-plus"></i> Create Profile
@@ -714,90 +432,20 @@ TEMPLATE = '''
             </div>
             
             <div class="main-content" id="profiles-container">
-                {% if checkins %}
-                    {% for checkin in checkins %}
-                    <div class="profile-card" data-airport="{{ checkin.Airport }}" data-terminal="{{ checkin.Terminal }}">
-                        {% if checkin.Is_Verified == 'True' %}
-                        <div class="verification-badge">
-                            <i class="fas fa-check-circle"></i> Verified
-                        </div>
-                        {% endif %}
-                        
-                        <div class="points-badge">
-                            <i class="fas fa-star"></i> {{ checkin.Points }} pts
-                        </div>
-                        
-                        <div class="profile-header">
-                            <div class="profile-avatar">
-                                {{ checkin.Name[0] if checkin.Name else 'U' }}
-                            </div>
-                            <div class="profile-info">
-                                <h3>{{ checkin.Name }}</h3>
-                                <p><i class="fas fa-map-marker-alt"></i> {{ checkin.Airport }} - {{ checkin.Terminal }}</p>
-                                <p><i class="fas fa-birthday-cake"></i> {{ checkin.Age }} years old</p>
-                            </div>
-                        </div>
-                        
-                        <div class="flight-info">
-                            <h4><i class="fas fa-plane"></i> Flight Details</h4>
-                            <div class="flight-details">
-                                <div><strong>Flight:</strong> {{ checkin.Flight_Number }}</div>
-                                <div><strong>Departure:</strong> {{ checkin.Departure_Time }}</div>
-                                <div><strong>Destination:</strong> {{ checkin.Destination }}</div>
-                                <div><strong>Purpose:</strong> {{ checkin.Travel_Purpose }}</div>
-                            </div>
-                            <div class="flight-status" id="status-{{ checkin.Flight_Number }}">
-                                <i class="fas fa-clock"></i> Checking status...
-                            </div>
-                        </div>
-                        
-                        <div class="profile-bio">
-                            "{{ checkin.Bio }}"
-                        </div>
-                        
-                        {% if checkin.Icebreaker_Response %}
-                        <div class="icebreaker-response">
-                            <strong>💬 Icebreaker:</strong> {{ checkin.Icebreaker_Response }}
-                        </div>
-                        {% endif %}
-                        
-                        {% if checkin.Interests %}
-                        <div class="profile-interests">
-                            {% for interest in checkin.Interests.split(', ') %}
-                            <span class="interest-tag">{{ interest }}</span>
-                            {% endfor %}
-                        </div>
-                        {% endif %}
-                        
-                        <div class="action-buttons">
-                            <button class="btn btn-primary" onclick="sendMessage('{{ checkin.Name }}')">
-                                <i class="fas fa-comment"></i> Message
-                            </button>
-                            <button class="btn btn-secondary" onclick="viewProfile('{{ checkin.Name }}')">
-                                <i class="fas fa-eye"></i> View Profile
-                            </button>
-                        </div>
-                        
-                        <div class="profile-timestamp">
-                            <i class="fas fa-clock"></i> Joined {{ checkin.Timestamp }}
-                        </div>
-                    </div>
-                    {% endfor %}
-                {% else %}
-                    <div class="profile-card" style="text-align: center; grid-column: 1 / -1;">
-                        <div class="success-icon" style="color: #667eea;">
-                            <i class="fas fa-users"></i>
-                        </div>
-                        <h3 style="margin-bottom: 10px;">No travelers yet</h3>
-                        <p style="color: #666;">Be the first to create a profile and start connecting with fellow travelers!</p>
-                    </div>
-                {% endif %}
+                {{ feed_html|safe }}
+            </div>
+            
+            <div style="text-align: center; margin-bottom: 30px;">
+                <button id="load-more" class="new-profile-btn" style="cursor: pointer; font-family: inherit; font-size: 1rem;{% if not next_cursor %} display: none;{% endif %}" data-cursor="{{ next_cursor or '' }}" onclick="loadFeed(true)">
+                    <i class="fas fa-chevron-down"></i> Load More Travelers
+                </button>
             </div>
         </div>
         
         <div id="messages-section" class="section" style="display: none;">
             <div class="messages-section">
                 <h2 class="section-title" style="color: #333;">Messages</h2>
+                <div id="messages-list" data-cursor="{{ messages[-1].Message_ID if messages else 0 }}">
                 {% if messages %}
                     {% for message in messages %}
                     <div class="message-item {% if message.Is_Read == 'False' %}unread{% endif %}">
@@ -809,8 +457,9 @@ TEMPLATE = '''
                     </div>
                     {% endfor %}
                 {% else %}
-                    <p style="text-align: center; color: #666; padding: 40px;">No messages yet. Start connecting with fellow travelers!</p>
+                    <p id="no-messages" style="text-align: center; color: #666; padding: 40px;">No messages yet. Start connecting with fellow travelers!</p>
                 {% endif %}
+                </div>
             </div>
         </div>
         
@@ -962,104 +611,21 @@ TEMPLATE = '''
         </div>
     </div>
     
-    <script>
-        function showSection(sectionName) {
-            // Hide all sections
-            document.querySelectorAll('.section').forEach(section => {
-                section.style.display = 'none';
-            });
-            
-            // Show selected section
-            document.getElementById(sectionName + '-section').style.display = 'block';
-            
-            // Update active tab
-            document.querySelectorAll('.nav-tab').forEach(tab => {
-                tab.classList.remove('active');
-            });
-            event.target.classList.add('active');
-        }
-        
-        function filterByLocation(airport) {
-            const profiles = document.querySelectorAll('.profile-card');
-            const filterOptions = document.querySelectorAll('.filter-option');
-            
-            // Update active filter
-            filterOptions.forEach(option => {
-                option.classList.remove('active');
-            });
-            event.target.classList.add('active');
-            
-            // Filter profiles
-            profiles.forEach(profile => {
-                if (airport === 'all' || profile.dataset.airport === airport) {
-                    profile.style.display = 'block';
-                } else {
-                    profile.style.display = 'none';
-                }
-            });
-        }
-        
-        function sendMessage(toName) {
-            const message = prompt('Enter your message to ' + toName + ':');
-            if (message) {
-                fetch('/send_message', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        to_name: toName,
-                        message: message
-                    })
-                }).then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        alert('Message sent successfully!');
-                        location.reload();
-                    } else {
-                        alert('Error sending message: ' + data.error);
-                    }
-                });
-            }
-        }
-        
-        function viewProfile(name) {
-            alert('Viewing profile of ' + name + ' (Feature coming soon!)');
-        }
-        
-        // Update flight statuses every 30 seconds
-        setInterval(() => {
-            document.querySelectorAll('.flight-status').forEach(statusElement => {
-                const flightNumber = statusElement.id.replace('status-', '');
-                fetch('/flight_status/' + flightNumber)
-                .then(response => response.json())
-                .then(data => {
-                    statusElement.innerHTML = '<i class="fas fa-clock"></i> ' + data.status;
-                });
-            });
-        }, 30000);
-        
-        // Initial flight status update
-        setTimeout(() => {
-            document.querySelectorAll('.flight-status').forEach(statusElement => {
-                const flightNumber = statusElement.id.replace('status-', '');
-                fetch('/flight_status/' + flightNumber)
-                .then(response => response.json())
-                .then(data => {
-                    statusElement.innerHTML = '<i class="fas fa-clock"></i> ' + data.status;
-                });
-            });
-        }, 1000);
-    </script>
+    <script src="{{ asset_url('app.js') }}"></script>
 </body>
 </html>
 '''
 
+# Templates are compiled once at import instead of on every request
+app.jinja_env.globals['asset_url'] = asset_url
+PROFILE_CARDS = app.jinja_env.from_string(PROFILE_CARDS_TEMPLATE)
+INDEX_TEMPLATE = app.jinja_env.from_string(TEMPLATE)
+
+# Schema setup runs once per process at startup, not on every request
+init_csv()
+
 @app.route('/', methods=['GET', 'POST'])
 def checkin():
-    # Initialize CSV files
-    init_csv()
-    
     if request.method == 'POST':
         name = request.form['name']
         age = request.form['age']
@@ -1077,24 +643,66 @@ def checkin():
         # Save profile to CSV
         save_profile(name, age, bio, airport, terminal, gate, flight_number, departure_time, destination, travel_purpose, interests, icebreaker_response)
         
-        # Get all profiles for display
-        checkins = get_all_profiles()
+        # First page of the traveler feed
+        checkins, next_cursor = get_feed_page()
         messages = get_messages_for_user(name)
         
-        return render_template_string(TEMPLATE, 
+        return render_template(INDEX_TEMPLATE, 
                                     checked_in=True, 
                                     name=name,
-                                    checkins=checkins,
-                                    messages=messages)
+                                    feed_html=render_feed(checkins),
+                                    next_cursor=next_cursor,
+                                    messages=messages,
+                                    unread=get_unread_count(name),
+                                    events_url=get_events_url())
+    
+    # The public page only changes with the data: answer 304 or serve the cached, compressed copy
+    airport, terminal = request.args.get('airport'), request.args.get('terminal')
+    tag, modified_at = get_index_version(airport, terminal)
     
-    # Get random icebreaker for the form
-    icebreaker = get_random_icebreaker()
+    def render_index():
+        # Get random icebreaker for the form
+        icebreaker = get_random_icebreaker()
+        
+        # First page of the traveler feed
+        checkins, next_cursor = get_feed_page(airport, terminal)
+        messages = []
+        
+        return render_template(INDEX_TEMPLATE, checked_in=False, feed_html=render_feed(checkins), next_cursor=next_cursor, messages=messages, icebreaker=icebreaker, events_url=get_events_url())
     
-    # Get all profiles for display
-    checkins = get_all_profiles()
-    messages = []
+    return index_pages.response(tag, modified_at, render_index)
+
+@app.route('/feed')
+def feed():
+    checkins, next_cursor = get_feed_page(request.args.get('airport'),
+                                          request.args.get('terminal'),
+                                          request.args.get('cursor', type=int),
+                                          request.args.get('limit', FEED_PAGE_SIZE, type=int))
+    first_page = 'cursor' not in request.args
+    return jsonify({'html': render_feed(checkins, first_page), 'count': len(checkins), 'next_cursor': next_cursor})
+
+@app.route('/api/profiles')
+def api_profiles():
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or API_PROFILE_FIELDS
+    unknown = [field for field in fields if field not in PROFILE_FIELDS]
+    if unknown:
+        return jsonify({'success': False, 'error': 'unknown field(s): %s' % ', '.join(unknown)}), 400
     
-    return render_template_string(TEMPLATE, checked_in=False, checkins=checkins, messages=messages, icebreaker=icebreaker)
+    checkins, next_cursor = get_feed_page(request.args.get('airport'),
+                                          request.args.get('terminal'),
+                                          request.args.get('cursor', type=int),
+                                          request.args.get('limit', FEED_PAGE_SIZE, type=int))
+    body = '{"profiles":%s,"next_cursor":%s}' % (profiles_to_json(checkins, fields), 'null' if next_cursor is None else int(next_cursor))
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/assets/<filename>')
+def assets(filename):
+    if filename not in ASSETS:
+        abort(404)
+    body, mimetype = ASSETS[filename]
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % ASSET_MAX_AGE
+    return response
 
 @app.route('/send_message', methods=['POST'])
 def send_message():
@@ -1109,11 +717,74 @@ def send_message():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/messages/<user_name>')
+def messages(user_name):
+    page, next_cursor = get_message_page(user_name,
+                                         request.args.get('with'),
+                                         request.args.get('before', type=int),
+                                         request.args.get('limit', MESSAGE_PAGE_SIZE, type=int))
+    return jsonify({'messages': page, 'next_cursor': next_cursor})
+
+@app.route('/messages/<user_name>/sync')
+def sync_messages(user_name):
+    limit = max(1, min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MAX_MESSAGE_PAGE_SIZE))
+    synced = get_messages_since(user_name, request.args.get('after', 0, type=int), limit)
+    if not synced:
+        # Nothing new: no body to build or send
+        return '', 204
+    return jsonify({'messages': synced, 'cursor': synced[-1]['Message_ID'], 'has_more': len(synced) == limit})
+
+@app.route('/unread/<user_name>')
+def unread(user_name):
+    return jsonify({'unread': get_unread_count(user_name, request.args.get('with'))})
+
+@app.route('/matches/<user_name>')
+def matches(user_name):
+    ranked = get_matches(user_name, request.args.get('airport'), request.args.get('k', MATCH_COUNT, type=int))
+    if ranked is None:
+        return jsonify({'success': False, 'error': 'No visible profile for %s' % user_name}), 404
+    return jsonify({'matches': [dict({field: profile.get(field, '') for field in PROFILE_FIELDS}, Match_Score=round(score, 3))
+                                for profile, score in ranked]})
+
+@app.route('/nearby/<user_name>')
+def nearby(user_name):
+    nearest, error = get_nearby(user_name, request.args.get('airport'), request.args.get('k', MATCH_COUNT, type=int))
+    if error:
+        return jsonify({'success': False, 'error': error}), 404
+    return jsonify({'nearby': [dict({field: profile.get(field, '') for field in PROFILE_FIELDS}, Walking_Meters=round(meters),
+                                    Walking_Minutes=round(meters / WALKING_SPEED, 1))
+                               for profile, meters in nearest]})
+
+@app.route('/search')
+def search():
+    airport = request.args.get('airport', '').strip()
+    query = request.args.get('q', '').strip()
+    if not airport or not query:
+        return jsonify({'success': False, 'error': 'airport and q are required'}), 400
+    
+    results = search_profiles(airport, query, request.args.get('limit', SEARCH_LIMIT, type=int))
+    return jsonify({'results': [dict({field: profile.get(field, '') for field in PROFILE_FIELDS}, Search_Score=round(score, 3))
+                                for profile, score in results]})
+
 @app.route('/flight_status/<flight_number>')
 def flight_status(flight_number):
     status = get_flight_status(flight_number)
     return jsonify({'status': status})
 
+@app.route('/flight_statuses', methods=['POST'])
+def flight_statuses():
+    data = request.get_json(silent=True) or {}
+    flights = data.get('flights')
+    if not isinstance(flights, list):
+        return jsonify({'success': False, 'error': 'flights must be a list'}), 400
+    
+    # Each distinct flight is looked up once, however many cards show it
+    unique_flights = list(dict.fromkeys(str(f).strip() for f in flights if str(f).strip()))
+    if len(unique_flights) > MAX_STATUS_BATCH:
+        return jsonify({'success': False, 'error': 'at most %d flights per request' % MAX_STATUS_BATCH}), 400
+    
+    return jsonify({'statuses': flight_status_cache.get_many(unique_flights)})
+
 @app.route('/verify_profile', methods=['POST'])
 def verify_profile():
     data = request.get_json()
@@ -1126,6 +797,21 @@ def verify_profile():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/metrics')
+def metrics():
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+def slow_requests():
+    if request_metrics.sampler is None:
+        return jsonify({'success': False, 'error': 'Set SLOW_REQUEST_MS to sample slow requests'}), 404
+    return jsonify({'requests': request_metrics.sampler.slowest()})
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify({'storage': storage.stats(), 'flight_statuses': flight_status_cache.stats(), 'events': event_hub.stats(), 'matches': match_ranker.stats(), 'gate_maps': gate_maps.stats(), 'index_pages': index_pages.stats()})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    # Development server; production runs serve.py (see Procfile)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=port)
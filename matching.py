@@ -0,0 +1,265 @@
+"""
+Match ranking: scores the travelers at an airport against one traveler
+
+Profiles are encoded once per airport into NumPy arrays (interests as 64-bit
+bitsets, departure times as minutes past midnight, destinations and travel
+purposes as integer codes), so ranking a traveler against every candidate is
+a handful of array operations rather than a Python loop. When the airport's
+profiles change only the new ones are encoded; the ones that left are masked.
+
+A traveler whose flight has already left gets no time score, so they rank
+below one still waiting at the gate:
+
+>>> ranker = MatchRanker()
+>>> me = {'Name': 'Me', 'Departure_Time': '11:00'}
+>>> rows = [{'Name': 'Gone', 'Departure_Time': '08:50'}, {'Name': 'Soon', 'Departure_Time': '09:20'}]
+>>> [row['Name'] for row, _ in ranker.rank(me, 'SFO', 1, lambda: rows, now_minutes=9 * 60)]
+['Soon', 'Gone']
+"""
+
+import operator
+import threading
+from itertools import repeat
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+MIN_SHARED_MINUTES = 45
+# Profiles leave the listings soon after departure, so a time this far behind now has passed
+DEPARTED_WINDOW = 6 * 60
+
+INTEREST_WEIGHT = 3.0
+TIME_WEIGHT = 2.0
+DESTINATION_WEIGHT = 1.5
+PURPOSE_WEIGHT = 1.0
+
+# Set bits in every byte value, for popcounts over uint64 bitsets
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def departure_minutes(value):
+    """Minutes past midnight for an 'HH:MM' departure time, or -1 if it cannot be read"""
+    try:
+        hours, minutes = value.strip().split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        return -1
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return -1
+    return hours * 60 + minutes
+
+
+def minutes_until(departures, now_minutes):
+    """Minutes from now to each departure, 0 once it has left
+
+    Departure times carry no date: one up to DEPARTED_WINDOW minutes behind
+    now has already gone, anything else is later today or tomorrow.
+    """
+    return np.maximum((departures - now_minutes + DEPARTED_WINDOW) % MINUTES_PER_DAY - DEPARTED_WINDOW, 0)
+
+
+def popcount(bits):
+    return _BYTE_POPCOUNT[bits.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int32)
+
+
+def _normalize(value):
+    return (value or '').strip().lower()
+
+
+class Vocabulary:
+    """Assigns stable integer codes to strings; the empty string is always -1"""
+
+    def __init__(self):
+        self._codes = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def code(self, value):
+        value = _normalize(value)
+        if not value:
+            return -1
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.setdefault(value, len(self._codes))
+        return code
+
+    def name_code(self, name):
+        """Code for a traveler's name, which is matched exactly rather than normalized"""
+        code = self._names.get(name)
+        if code is None:
+            with self._lock:
+                code = self._names.setdefault(name, len(self._names))
+        return code
+
+    def interest_bits(self, interests):
+        # Interests past the 64th distinct one share bits; overlap is then slightly overestimated
+        bits = 0
+        for interest in (interests or '').split(','):
+            code = self.code(interest)
+            if code >= 0:
+                bits |= 1 << (code % 64)
+        return bits
+
+
+def _row_keys(rows):
+    # Every check-in of a traveler has its own timestamp, and a saved profile never changes
+    return list(zip(map(operator.methodcaller('get', 'Name'), rows), map(operator.methodcaller('get', 'Timestamp'), rows)))
+
+
+class CandidateArrays:
+    """Column arrays for one airport's profiles, one slot per profile in check-in order
+
+    Slots of profiles that left the store stay in place, masked out by
+    alive, until they are half of all slots. Arrays are never changed once
+    built; update() returns new ones so concurrent rankings are unaffected.
+    """
+
+    def __init__(self, rows, keys, names, interests, departures, destinations, purposes, alive, slots=None):
+        self.rows = rows
+        self.keys = keys
+        self.names = names
+        self.interests = interests
+        self.departures = departures
+        self.destinations = destinations
+        self.purposes = purposes
+        self.alive = alive
+        self.slots = slots if slots is not None else dict(zip(keys, range(len(keys))))
+        # Stores hand back the same row objects until they reload, so most rows are found by identity
+        ids = np.fromiter(map(id, rows), dtype=np.int64, count=len(rows))
+        self.id_order = np.argsort(ids)
+        self.sorted_ids = ids[self.id_order]
+        # Someone who checked in more than once is ranked on their latest profile only
+        live = np.flatnonzero(alive)
+        _, last = np.unique(names[live][::-1], return_index=True)
+        self.is_latest = np.zeros(len(rows), dtype=bool)
+        self.is_latest[live[len(live) - 1 - last]] = True
+
+    @classmethod
+    def encode(cls, rows, vocabulary):
+        return cls(rows, _row_keys(rows),
+                   np.fromiter((vocabulary.name_code(row.get('Name')) for row in rows), dtype=np.int32, count=len(rows)),
+                   np.fromiter((vocabulary.interest_bits(row.get('Interests')) for row in rows), dtype=np.uint64, count=len(rows)),
+                   np.fromiter((departure_minutes(row.get('Departure_Time')) for row in rows), dtype=np.int32, count=len(rows)),
+                   np.fromiter((vocabulary.code(row.get('Destination')) for row in rows), dtype=np.int32, count=len(rows)),
+                   np.fromiter((vocabulary.code(row.get('Travel_Purpose')) for row in rows), dtype=np.int32, count=len(rows)),
+                   np.ones(len(rows), dtype=bool))
+
+    def find(self, rows):
+        """Slot of each row, or -1 for rows not encoded yet"""
+        if not self.rows:
+            return np.full(len(rows), -1, dtype=np.int64)
+        # Rows held here keep their ids from being reused by new ones
+        ids = np.fromiter(map(id, rows), dtype=np.int64, count=len(rows))
+        at = np.minimum(np.searchsorted(self.sorted_ids, ids), len(self.rows) - 1)
+        slots = np.where(self.sorted_ids[at] == ids, self.id_order[at], -1)
+        # Rows that are copies (a reloaded file, or a database query) are found by key
+        missing = np.flatnonzero(slots < 0)
+        if len(missing):
+            keys = _row_keys([rows[position] for position in missing.tolist()])
+            slots[missing] = np.fromiter(map(self.slots.get, keys, repeat(-1)), dtype=np.int64, count=len(keys))
+        return slots
+
+    def update(self, rows, vocabulary):
+        """Arrays for the airport's current rows, encoding only the ones not seen before"""
+        slots = self.find(rows)
+        alive = np.zeros(len(self.rows), dtype=bool)
+        alive[slots[slots >= 0]] = True
+        added = [rows[position] for position in np.flatnonzero(slots < 0).tolist()]
+        if not added and np.array_equal(alive, self.alive):
+            return self
+        kept = self
+        if 2 * np.count_nonzero(alive) < len(alive):
+            # Mostly dead slots: drop them, keeping the encoding of the rest
+            take = np.flatnonzero(alive)
+            kept = CandidateArrays([self.rows[slot] for slot in take.tolist()], [self.keys[slot] for slot in take.tolist()], self.names[take],
+                                   self.interests[take], self.departures[take], self.destinations[take], self.purposes[take],
+                                   np.ones(len(take), dtype=bool))
+            alive = kept.alive
+        new = CandidateArrays.encode(added, vocabulary)
+        slots = dict(kept.slots)
+        slots.update(zip(new.keys, range(len(kept.rows), len(kept.rows) + len(added))))
+        return CandidateArrays(kept.rows + added, kept.keys + new.keys,
+                               np.concatenate((kept.names, new.names)),
+                               np.concatenate((kept.interests, new.interests)),
+                               np.concatenate((kept.departures, new.departures)),
+                               np.concatenate((kept.destinations, new.destinations)),
+                               np.concatenate((kept.purposes, new.purposes)),
+                               np.concatenate((alive, new.alive)),
+                               slots)
+
+
+class MatchRanker:
+    """Ranks candidates for a traveler, caching the encoded arrays per airport"""
+
+    def __init__(self, max_airports=64):
+        self.max_airports = max_airports
+        self.vocabulary = Vocabulary()
+        self._arrays = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def arrays(self, airport, version, load_rows):
+        """Encoded profiles at airport; load_rows() is only called when version changed"""
+        cached = self._arrays.get(airport)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        if cached is None:
+            arrays = CandidateArrays.encode(load_rows(), self.vocabulary)
+        else:
+            arrays = cached[1].update(load_rows(), self.vocabulary)
+        with self._lock:
+            self._arrays.pop(airport, None)
+            if len(self._arrays) >= self.max_airports:
+                # Evict the airport encoded longest ago
+                del self._arrays[next(iter(self._arrays))]
+            self._arrays[airport] = (version, arrays)
+        return arrays
+
+    def scores(self, traveler, arrays, now_minutes):
+        """Score of every candidate for traveler; -inf for the traveler and superseded profiles"""
+        mine = np.uint64(self.vocabulary.interest_bits(traveler.get('Interests')))
+        shared = popcount(arrays.interests & mine)
+        union = popcount(arrays.interests | mine)
+        interest_score = np.divide(shared, union, out=np.zeros(len(shared)), where=union > 0)
+
+        # Both are around until the earlier of the two departures
+        my_departure = departure_minutes(traveler.get('Departure_Time'))
+        if my_departure >= 0:
+            my_left = minutes_until(my_departure, now_minutes)
+            their_left = minutes_until(arrays.departures, now_minutes)
+            time_score = np.minimum(np.minimum(their_left, my_left) / MIN_SHARED_MINUTES, 1.0)
+            time_score[arrays.departures < 0] = 0.0
+        else:
+            time_score = np.zeros(len(arrays.rows))
+
+        destination = self.vocabulary.code(traveler.get('Destination'))
+        purpose = self.vocabulary.code(traveler.get('Travel_Purpose'))
+        scores = (INTEREST_WEIGHT * interest_score
+                  + TIME_WEIGHT * time_score
+                  + DESTINATION_WEIGHT * ((arrays.destinations == destination) & (destination >= 0))
+                  + PURPOSE_WEIGHT * ((arrays.purposes == purpose) & (purpose >= 0)))
+        scores[~arrays.is_latest] = -np.inf
+        scores[arrays.names == self.vocabulary.name_code(traveler.get('Name'))] = -np.inf
+        return scores
+
+    def rank(self, traveler, airport, version, load_rows, now_minutes, k=10):
+        """Top k (row, score) pairs for traveler among the airport's profiles, best first
+
+        version identifies the airport's visible profiles and load_rows()
+        returns them; see arrays().
+        """
+        arrays = self.arrays(airport, version, load_rows)
+        if not arrays.rows or k <= 0:
+            return []
+        scores = self.scores(traveler, arrays, now_minutes)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(arrays.rows[i], float(scores[i])) for i in top if scores[i] != -np.inf]
+
+    def stats(self):
+        return {'airports': len(self._arrays), 'hits': self.hits, 'misses': self.misses}
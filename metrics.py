@@ -0,0 +1,285 @@
+"""
+Request and stage timing exported as Prometheus text metrics
+
+Flask hooks time every request; stage() and timed_stage() time named parts
+of the work (CSV reads, filtering, template rendering, writes) wherever
+they happen. A stage records its self time: time spent in stages nested
+inside it counts only toward those, so the stages of a request add up to
+no more than the request itself. An optional sampler records the stacks of slow requests.
+Every process keeps its own numbers, so under serve.py each worker reports
+the requests it served.
+"""
+
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import before_render_template, g, request, template_rendered
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s counter' % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, _labels(self.label_names, labels), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append('%s_bucket%s %d' % (self.name, _labels(self.label_names, labels, [('le', repr(bound))]), cumulative))
+                lines.append('%s_bucket%s %d' % (self.name, _labels(self.label_names, labels, [('le', '+Inf')]), count))
+                lines.append('%s_sum%s %r' % (self.name, _labels(self.label_names, labels), total))
+                lines.append('%s_count%s %d' % (self.name, _labels(self.label_names, labels), count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+stage_seconds = registry.histogram('connections_stage_seconds', 'Time spent in a named stage of request handling', ('stage',))
+request_seconds = registry.histogram('connections_request_seconds', 'Request latency by route', ('route', 'method'))
+requests_total = registry.counter('connections_requests_total', 'Requests handled by route and status', ('route', 'method', 'status'))
+
+_local = threading.local()
+
+
+def _enter():
+    # Frames of the stages open on this thread: [started, seconds spent in nested stages]
+    frames = getattr(_local, 'frames', None)
+    if frames is None:
+        frames = _local.frames = []
+    frames.append([time.perf_counter(), 0.0])
+
+
+def _exit(name):
+    # Record self time only, so nested stages (a CSV reload inside a filter) are never counted twice
+    frames = _local.frames
+    started, nested = frames.pop()
+    elapsed = time.perf_counter() - started
+    if frames:
+        frames[-1][1] += elapsed
+    own = max(elapsed - nested, 0.0)
+    stage_seconds.observe(own, name)
+    stages = getattr(_local, 'stages', None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + own
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage, excluding stages nested inside it; also adds it to the current request's breakdown"""
+    _enter()
+    try:
+        yield
+    finally:
+        _exit(name)
+
+
+def timed_stage(name):
+    """Decorator form of stage()"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _fold(frame):
+    # One line per stack, root first, in the folded format flame graph tools read
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class SlowRequestSampler:
+    """Samples the stacks of in-flight requests and keeps those of the slowest ones
+
+    A background thread reads every request thread's current frame each
+    interval seconds. When a request finishes above threshold seconds its
+    stack counts are kept, up to the keep slowest requests.
+    """
+
+    def __init__(self, threshold, interval=0.005, keep=20, stacks_per_request=10):
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+        self.stacks_per_request = stacks_per_request
+        self._active = {}
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def begin(self):
+        self._ensure_running()
+        self._active[threading.get_ident()] = {}
+
+    def end(self, record):
+        samples = self._active.pop(threading.get_ident(), {})
+        if record['duration_ms'] < self.threshold * 1000:
+            return
+        stacks = sorted(samples.items(), key=lambda item: -item[1])[:self.stacks_per_request]
+        record = dict(record, samples=sum(samples.values()), stacks=[{'stack': stack, 'samples': count} for stack, count in stacks])
+        with self._lock:
+            entry = (record['duration_ms'], next(self._sequence), record)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self):
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, samples in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None and ident != me:
+                    stack = _fold(frame)
+                    samples[stack] = samples.get(stack, 0) + 1
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._active = {}
+                threading.Thread(target=self._run, name='slow-request-sampler', daemon=True).start()
+                self._pid = os.getpid()
+
+
+class RequestMetrics:
+    """Flask hooks timing each request and every template render"""
+
+    def __init__(self, sampler=None):
+        self.sampler = sampler
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._rendered, app, weak=False)
+
+    def _before(self):
+        g.metrics_started = time.perf_counter()
+        _local.stages = {}
+        _local.frames = []
+        _local.renders = 0
+        if self.sampler is not None:
+            self.sampler.begin()
+
+    def _after(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown(self, exception):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = g.pop('metrics_status', 500)
+        request_seconds.observe(elapsed, route, request.method)
+        requests_total.inc(route, request.method, str(status))
+        stages, _local.stages = _local.stages, None
+        if self.sampler is not None:
+            self.sampler.end({'method': request.method, 'path': request.full_path.rstrip('?'), 'route': route, 'status': status,
+                              'duration_ms': round(elapsed * 1000, 3),
+                              'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in stages.items()}})
+
+    def _before_render(self, sender, template, context, **extra):
+        if getattr(_local, 'renders', None) is not None:
+            _local.renders += 1
+            _enter()
+
+    def _rendered(self, sender, template, context, **extra):
+        if getattr(_local, 'renders', None):
+            _local.renders -= 1
+            _exit('render')
@@ -0,0 +1,156 @@
+"""
+Full-text search over profile text, with an inverted index per airport
+
+Bio, Interests, Destination and Icebreaker_Response are split into lowercase
+word tokens. Each airport keeps postings (term -> {document: weight}) and a
+sorted term list, so a query word also matches every term it is a prefix of
+with one bisect. Documents are added and removed one at a time as profiles
+are saved and expire; nothing is rebuilt for a query.
+"""
+
+import bisect
+import heapq
+import math
+import re
+
+# Weight of a term by the field it appears in
+SEARCH_FIELDS = {'Destination': 3.0, 'Interests': 2.0, 'Bio': 1.0, 'Icebreaker_Response': 1.0}
+
+# Query words shorter than this only match whole terms
+MIN_PREFIX_LENGTH = 2
+# Longer terms a query word may expand to, in term order
+MAX_PREFIX_TERMS = 64
+# A prefix match counts for less than the whole word
+PREFIX_WEIGHT = 0.5
+
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Lowercase word tokens of text; punctuation and underscores separate words"""
+    return _TOKEN.findall((text or '').lower())
+
+
+def document_terms(row):
+    """Weight of every term in a profile, summed over the searched fields"""
+    weights = {}
+    for field, weight in SEARCH_FIELDS.items():
+        for term in tokenize(row.get(field)):
+            weights[term] = weights.get(term, 0.0) + weight
+    return weights
+
+
+class TextIndex:
+    """Inverted index over one airport's documents, keyed by any sortable document id"""
+
+    def __init__(self):
+        self._postings = {}
+        self._terms = []
+        self._documents = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, document, row):
+        self.remove(document)
+        weights = document_terms(row)
+        self._documents[document] = tuple(weights)
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[document] = weight
+
+    def remove(self, document):
+        terms = self._documents.pop(document, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[document]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, word):
+        # The word itself and the terms it prefixes, each with how much a match counts
+        if len(word) < MIN_PREFIX_LENGTH:
+            return [(word, 1.0)] if word in self._postings else []
+        matches = []
+        start = bisect.bisect_left(self._terms, word)
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(word):
+                break
+            matches.append((term, 1.0 if term == word else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query, limit=20):
+        """Top limit (document, score) pairs matching every query word, best first"""
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or limit <= 0:
+            return []
+        scores = None
+        for word in words:
+            # A document scores its best-matching term for each word, weighted by how rare the term is
+            word_scores = {}
+            for term, factor in self._expand(word):
+                postings = self._postings[term]
+                rarity = math.log(1 + len(self._documents) / len(postings))
+                for document, weight in postings.items():
+                    score = factor * weight * rarity
+                    if score > word_scores.get(document, 0.0):
+                        word_scores[document] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {document: score + word_scores[document] for document, score in scores.items() if document in word_scores}
+            if not scores:
+                return []
+        # Ties go to the newer document
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+    def stats(self):
+        return {'documents': len(self._documents), 'terms': len(self._terms)}
+
+
+class ProfileSearch:
+    """One TextIndex per airport, holding each traveler's latest profile there
+
+    Document ids must grow with check-in order (store positions or row ids),
+    so a newer profile from the same traveler replaces the older one.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._latest = {}
+
+    def add(self, document, row):
+        airport, key = row.get('Airport'), (row.get('Airport'), row.get('Name'))
+        previous = self._latest.get(key)
+        if previous is not None and previous > document:
+            return
+        index = self._indexes.setdefault(airport, TextIndex())
+        if previous is not None:
+            index.remove(previous)
+        self._latest[key] = document
+        index.add(document, row)
+
+    def remove(self, document, row):
+        airport, key = row.get('Airport'), (row.get('Airport'), row.get('Name'))
+        if self._latest.get(key) != document:
+            return
+        del self._latest[key]
+        index = self._indexes[airport]
+        index.remove(document)
+        if not len(index):
+            del self._indexes[airport]
+
+    def search(self, airport, query, limit=20):
+        index = self._indexes.get(airport)
+        return index.search(query, limit) if index is not None else []
+
+    def stats(self):
+        return {'airports': len(self._indexes),
+                'documents': sum(len(index) for index in self._indexes.values()),
+                'terms': sum(index.stats()['terms'] for index in self._indexes.values())}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Production server for Connections Airport App
+
+The master process loads the app and its data, binds the listening socket
+and forks one worker per CPU core. Each worker serves requests from a
+bounded thread pool using the stdlib WSGI server. The master also hosts
+the Server-Sent Events hub and replaces workers that exit.
+
+Signals to the master:
+  SIGHUP           reload data and replace every worker gracefully
+  SIGTERM/SIGINT   stop accepting connections, let workers finish, exit
+
+Environment: PORT (5001), WEB_CONCURRENCY (usable CPUs), WEB_THREADS (8),
+GRACEFUL_TIMEOUT (30 seconds).
+"""
+
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+
+class ThreadPoolWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server handing each connection to a fixed-size thread pool"""
+
+    daemon_threads = True
+
+    def __init__(self, listener, app, threads):
+        WSGIServer.__init__(self, listener.getsockname()[:2], WSGIRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        host, port = listener.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        # The listening socket belongs to the master; only drain the pool here
+        self.pool.shutdown(wait=True)
+
+
+def usable_cpus():
+    """CPUs this process may run on: its affinity mask, capped by a cgroup v2 CPU quota"""
+    if hasattr(os, 'process_cpu_count'):
+        cpus = os.process_cpu_count()
+    elif hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count()
+    cpus = cpus or 1
+    # Containers are often limited by quota rather than affinity ("max 100000" means no limit)
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as file:
+            quota, period = file.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def default_workers():
+    return int(os.environ.get('WEB_CONCURRENCY') or usable_cpus())
+
+
+def run_worker(listener, app, threads):
+    server = ThreadPoolWSGIServer(listener, app, threads)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever(), so it must run off the main thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class Master:
+    def __init__(self, host, port, workers, threads, graceful_timeout):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.children = set()
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.main.event_hub.relay_to(self.relay_path)
+                run_worker(self.listener, self.main.app, self.threads)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+        return pid
+
+    def stop_children(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # Workers finish their in-flight requests; stragglers are killed after the timeout
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children.intersection(pids) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children.intersection(pids):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.discard(pid)
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self.reloading = True
+        else:
+            self.stopping = True
+
+    def run(self):
+        self.listener = socket.create_server((self.host, self.port), backlog=2048)
+        # Workers share the socket: whoever loses the race for a connection gets
+        # BlockingIOError back from accept() instead of hanging in it past SIGTERM
+        self.listener.setblocking(False)
+        self.relay_path = os.path.join(tempfile.gettempdir(), 'connections-events-%d.sock' % os.getpid())
+
+        # Import and warm up once so workers share the loaded data copy-on-write
+        import main
+        self.main = main
+        main.warm_up()
+        main.event_hub.ensure_started('0.0.0.0', main.EVENTS_PORT, relay_path=self.relay_path)
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self.handle_signal)
+
+        print('🛫 Serving on http://%s:%d with %d workers x %d threads' % (self.host, self.port, self.workers, self.threads))
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while not self.stopping:
+                if self.reloading:
+                    self.reloading = False
+                    # Start the replacements first so the socket is never left unserved
+                    old = list(self.children)
+                    main.warm_up()
+                    for _ in range(self.workers):
+                        self.spawn()
+                    self.stop_children(old)
+                self.reap()
+                for _ in range(self.workers - len(self.children)):
+                    if not self.stopping:
+                        self.spawn()
+                time.sleep(0.5)
+        finally:
+            self.stop_children(list(self.children))
+            self.listener.close()
+            if os.path.exists(self.relay_path):
+                os.unlink(self.relay_path)
+
+
+def main():
+    if not hasattr(os, 'fork'):
+        sys.exit('serve.py needs a platform with fork(); use "python main.py" instead')
+    Master(host=os.environ.get('HOST', '0.0.0.0'),
+           port=int(os.environ.get('PORT', 5001)),
+           workers=default_workers(),
+           threads=int(os.environ.get('WEB_THREADS', 8)),
+           graceful_timeout=float(os.environ.get('GRACEFUL_TIMEOUT', 30))).run()
+
+
+if __name__ == '__main__':
+    main()
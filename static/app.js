@@ -0,0 +1,228 @@
+function showSection(sectionName) {
+    // Hide all sections
+    document.querySelectorAll('.section').forEach(section => {
+        section.style.display = 'none';
+    });
+    
+    // Show selected section
+    document.getElementById(sectionName + '-section').style.display = 'block';
+    
+    // Update active tab
+    document.querySelectorAll('.nav-tab').forEach(tab => {
+        tab.classList.remove('active');
+    });
+    event.target.classList.add('active');
+}
+
+let feedAirport = '';
+
+function setFeedCursor(cursor) {
+    const loadMore = document.getElementById('load-more');
+    loadMore.dataset.cursor = cursor === null ? '' : cursor;
+    loadMore.style.display = cursor === null ? 'none' : 'inline-block';
+}
+
+function loadFeed(append) {
+    const params = new URLSearchParams();
+    const cursor = document.getElementById('load-more').dataset.cursor;
+    if (feedAirport) {
+        params.set('airport', feedAirport);
+    }
+    if (append && cursor) {
+        params.set('cursor', cursor);
+    }
+    fetch('/feed?' + params.toString())
+    .then(response => response.json())
+    .then(data => {
+        const container = document.getElementById('profiles-container');
+        if (append) {
+            container.insertAdjacentHTML('beforeend', data.html);
+        } else {
+            container.innerHTML = data.html;
+        }
+        setFeedCursor(data.next_cursor);
+        updateFlightStatuses();
+    });
+}
+
+function filterByLocation(airport) {
+    const filterOptions = document.querySelectorAll('.filter-option');
+    
+    // Update active filter
+    filterOptions.forEach(option => {
+        option.classList.remove('active');
+    });
+    event.target.classList.add('active');
+    
+    // Fetch the first page of matching profiles from the server
+    feedAirport = airport === 'all' ? '' : airport;
+    loadFeed(false);
+}
+
+function sendMessage(toName) {
+    const message = prompt('Enter your message to ' + toName + ':');
+    if (message) {
+        fetch('/send_message', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                to_name: toName,
+                message: message
+            })
+        }).then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                alert('Message sent successfully!');
+            } else {
+                alert('Error sending message: ' + data.error);
+            }
+        });
+    }
+}
+
+function viewProfile(name) {
+    alert('Viewing profile of ' + name + ' (Feature coming soon!)');
+}
+
+// Largest batch /flight_statuses accepts (MAX_STATUS_BATCH in main.py)
+const STATUS_BATCH_SIZE = 500;
+
+function updateFlightStatuses() {
+    const statusElements = document.querySelectorAll('.flight-status');
+    const flights = [...new Set([...statusElements].map(element => element.dataset.flight))];
+    
+    // One request per refresh cycle for every batch of flights on screen
+    for (let start = 0; start < flights.length; start += STATUS_BATCH_SIZE) {
+        fetch('/flight_statuses', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ flights: flights.slice(start, start + STATUS_BATCH_SIZE) })
+        }).then(response => response.json())
+        .then(data => {
+            if (!data.statuses) {
+                return;
+            }
+            statusElements.forEach(statusElement => {
+                const status = data.statuses[statusElement.dataset.flight];
+                if (status) {
+                    statusElement.innerHTML = '<i class="fas fa-clock"></i> ' + status;
+                }
+            });
+        });
+    }
+}
+
+function showIncomingMessage(message) {
+    const placeholder = document.getElementById('no-messages');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    
+    const item = document.createElement('div');
+    item.className = 'message-item unread';
+    item.innerHTML = '<div class="message-header"><span class="message-sender"></span><span class="message-time"></span></div><div class="message-content"></div>';
+    item.querySelector('.message-sender').textContent = message.from_name;
+    item.querySelector('.message-time').textContent = message.timestamp;
+    item.querySelector('.message-content').textContent = message.message;
+    document.getElementById('messages-list').prepend(item);
+}
+
+function updateUnreadBadge() {
+    const user = document.body.dataset.user;
+    if (!user) {
+        return;
+    }
+    
+    fetch('/unread/' + encodeURIComponent(user))
+    .then(response => response.json())
+    .then(data => {
+        const badge = document.getElementById('unread-badge');
+        badge.textContent = data.unread;
+        badge.style.display = data.unread ? 'inline' : 'none';
+    });
+}
+
+// Fetch only the messages newer than the last one shown
+let syncingMessages = false;
+
+function syncMessages() {
+    const user = document.body.dataset.user;
+    const list = document.getElementById('messages-list');
+    if (!user || syncingMessages) {
+        return;
+    }
+    
+    syncingMessages = true;
+    fetch('/messages/' + encodeURIComponent(user) + '/sync?after=' + (list.dataset.cursor || 0))
+    .then(response => response.status === 204 ? null : response.json())
+    .then(data => {
+        syncingMessages = false;
+        if (!data) {
+            return;
+        }
+        data.messages.forEach(message => {
+            showIncomingMessage({ from_name: message.From_Name, message: message.Message, timestamp: message.Timestamp });
+        });
+        list.dataset.cursor = data.cursor;
+        if (data.has_more) {
+            syncMessages();
+        } else {
+            updateUnreadBadge();
+        }
+    })
+    .catch(() => { syncingMessages = false; });
+}
+
+// Flight status changes and new messages are pushed over Server-Sent Events when available
+let liveUpdates = false;
+
+function connectEvents() {
+    const eventsUrl = document.body.dataset.eventsUrl;
+    if (!eventsUrl || !window.EventSource) {
+        return;
+    }
+    
+    const user = document.body.dataset.user;
+    const source = new EventSource(user ? eventsUrl + '?user=' + encodeURIComponent(user) : eventsUrl);
+    source.onopen = () => {
+        liveUpdates = true;
+        // Pick up anything sent while the stream was down
+        syncMessages();
+    };
+    source.onerror = () => { liveUpdates = false; };
+    source.addEventListener('flight_status', event => {
+        const data = JSON.parse(event.data);
+        document.querySelectorAll('.flight-status').forEach(statusElement => {
+            if (statusElement.dataset.flight === data.flight) {
+                statusElement.innerHTML = '<i class="fas fa-clock"></i> ' + data.status;
+            }
+        });
+    });
+    // The event is only a nudge; the sync endpoint delivers the message and advances the cursor
+    source.addEventListener('new_message', () => {
+        syncMessages();
+    });
+}
+
+connectEvents();
+
+// Poll flight statuses every 30 seconds while the event stream is down
+setInterval(() => {
+    if (!liveUpdates) {
+        updateFlightStatuses();
+    }
+}, 30000);
+
+// Poll for new messages every 5 seconds while the event stream is down
+setInterval(() => {
+    if (!liveUpdates) {
+        syncMessages();
+    }
+}, 5000);
+
+// Initial flight status update
+setTimeout(updateFlightStatuses, 1000);
@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+"""
+Pluggable persistence for profiles, messages and verifications
+
+CsvStorage keeps the original CSV files (cached in memory by stores.py);
+SqliteStorage keeps everything in one SQLite database in WAL mode.
+"""
+
+import argparse
+import csv
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import stage
+from search import ProfileSearch
+from stores import RECEIPT_FIELDS, MessageStore, ProfileStore, RetentionPolicy, VerificationStore
+from writer import file_lock, shared_writer
+
+PROFILE_FIELDS = ['Name', 'Age', 'Bio', 'Airport', 'Terminal', 'Gate', 'Flight_Number', 'Departure_Time', 'Destination', 'Travel_Purpose', 'Interests', 'Icebreaker_Response', 'Points', 'Is_Visible', 'Is_Verified', 'Timestamp']
+MESSAGE_FIELDS = ['From_Name', 'To_Name', 'Message', 'Timestamp', 'Is_Read']
+VERIFICATION_FIELDS = ['Name', 'Verification_Type', 'Status', 'Timestamp']
+
+NOT_VERIFIED = 'Not_Verified'
+VERIFIED = 'Verified'
+IMPORT_BATCH_SIZE = 1000
+
+# Bumped whenever the data layout changes; CSV_MIGRATIONS upgrades older files
+SCHEMA_VERSION = 4
+
+
+def align_row(header, values, fields, defaults=None):
+    """Map one raw CSV record onto fields by its header's column names
+
+    Records are only taken by position when the header is fields itself, or
+    when a full-layout record does not fit its header: one appended in the
+    current layout to a file whose header predates a column.
+    """
+    defaults = defaults or {}
+    if header == fields or len(values) == len(fields) != len(header):
+        return list(values)
+    by_name = dict(zip(header, values))
+    return [by_name.get(field, defaults.get(field, '')) for field in fields]
+
+
+def rewrite_csv(path, fields, defaults=None):
+    """Stream a CSV file into the given column layout and atomically swap it in
+
+    Rows are converted one at a time into a temp file beside the original,
+    so memory stays bounded however large the file is. Returns False when the
+    file already has the layout.
+    """
+    with file_lock(path + '.lock'):
+        with open(path, 'r', newline='', encoding='utf-8') as source:
+            reader = csv.reader(source)
+            header = next(reader, None) or []
+            if header == fields:
+                return False
+            temp_path = path + '.migrating'
+            with open(temp_path, 'w', newline='', encoding='utf-8') as target:
+                writer = csv.writer(target)
+                writer.writerow(fields)
+                for values in reader:
+                    if values:
+                        writer.writerow(align_row(header, values, fields, defaults))
+                target.flush()
+                os.fsync(target.fileno())
+        os.replace(temp_path, path)
+        return True
+
+
+def _add_profile_verified_column(storage):
+    # save_profile() has always written Is_Verified, but files created before
+    # the column reached the header hold 15-column rows next to 16-column ones
+    rewrite_csv(storage.profiles_path, PROFILE_FIELDS, {'Is_Verified': 'False'})
+
+
+# (version, migration) pairs applied in order to CSV data older than that version
+CSV_MIGRATIONS = [
+    (2, _add_profile_verified_column),
+]
+
+
+class Storage:
+    """Interface main.py uses for all persistence"""
+
+    def init_schema(self):
+        raise NotImplementedError
+
+    def add_profile(self, values):
+        raise NotImplementedError
+
+    def all_profiles(self):
+        raise NotImplementedError
+
+    def visible_profiles(self):
+        raise NotImplementedError
+
+    def profiles_by_airport(self, airport):
+        raise NotImplementedError
+
+    def profiles_by_location(self, airport, terminal):
+        raise NotImplementedError
+
+    def profile_page(self, airport=None, terminal=None, cursor=None, limit=20):
+        raise NotImplementedError
+
+    def latest_profile(self, name, airport=None):
+        """Newest visible profile for a name, optionally only at an airport, or None; an index lookup"""
+        raise NotImplementedError
+
+    def profiles_version(self, airport):
+        """Cheap token that changes whenever the visible profiles at an airport do (it may change more often)"""
+        raise NotImplementedError
+
+    def search_profiles(self, airport, query, limit=20):
+        """Best (profile, score) matches for a text query among the visible profiles at an airport"""
+        raise NotImplementedError
+
+    def add_message(self, values):
+        raise NotImplementedError
+
+    def messages_for_user(self, user_name):
+        raise NotImplementedError
+
+    def message_page_for_user(self, user_name, cursor=None, limit=50):
+        raise NotImplementedError
+
+    def message_page_for_conversation(self, first_name, second_name, cursor=None, limit=50):
+        raise NotImplementedError
+
+    def messages_since(self, user_name, after=0, limit=50):
+        """Messages a user sent or received with IDs above after, oldest first, at most limit"""
+        raise NotImplementedError
+
+    def mark_messages_read(self, from_name, to_name, timestamp, read_at):
+        raise NotImplementedError
+
+    def unread_count(self, user_name, from_name=None):
+        """Unread messages sent to a user, or only those from from_name; a counter lookup, not a scan"""
+        raise NotImplementedError
+
+    def add_verification(self, values):
+        raise NotImplementedError
+
+    def verification_status(self, name):
+        """Latest verification status for a name, or NOT_VERIFIED"""
+        raise NotImplementedError
+
+    def verification_statuses(self, names):
+        """Latest status for every given name that has one, looked up in one batch"""
+        raise NotImplementedError
+
+    def feed_version(self):
+        """(token, modified_at): the token changes whenever visible profiles or verification
+        statuses do, and modified_at is when that last happened, in epoch seconds"""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Load data into memory ahead of serving (before serve.py forks workers)"""
+
+    def compact(self):
+        """Periodic maintenance (including archiving expired profiles); safe to call from a background thread"""
+
+    def stats(self):
+        return {}
+
+
+class CsvStorage(Storage):
+    """The original CSV files, served from process-wide in-memory caches"""
+
+    def __init__(self, profiles_path, messages_path, verifications_path, receipts_path, version_path=None,
+                 archive_path=None, retention=None):
+        self.profiles_path = profiles_path
+        self.messages_path = messages_path
+        self.verifications_path = verifications_path
+        self.receipts_path = receipts_path
+        self.version_path = version_path or os.path.join(os.path.dirname(profiles_path), 'schema_version')
+        self.archive_path = archive_path or os.path.splitext(profiles_path)[0] + '_archive.csv'
+        self.profiles = ProfileStore(profiles_path, retention=retention or RetentionPolicy())
+        self.messages = MessageStore(messages_path, receipts_path)
+        self.verifications = VerificationStore(verifications_path)
+
+    def init_schema(self):
+        existing = [path for path in (self.profiles_path, self.messages_path, self.verifications_path) if os.path.exists(path)]
+        for path, fields in [(self.profiles_path, PROFILE_FIELDS),
+                             (self.messages_path, MESSAGE_FIELDS),
+                             (self.verifications_path, VERIFICATION_FIELDS),
+                             (self.receipts_path, RECEIPT_FIELDS)]:
+            if not os.path.exists(path):
+                with open(path, 'w', newline='') as file:
+                    csv.writer(file).writerow(fields)
+        if not existing and not os.path.exists(self.version_path):
+            # Freshly created files already have the current layout
+            self._set_schema_version(SCHEMA_VERSION)
+        self.migrate()
+
+    def schema_version(self):
+        try:
+            with open(self.version_path) as file:
+                return int(file.read().strip() or 1)
+        except FileNotFoundError:
+            return 1
+
+    def _set_schema_version(self, version):
+        temp_path = self.version_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            file.write('%d\n' % version)
+        os.replace(temp_path, self.version_path)
+
+    def migrate(self):
+        """Apply every CSV migration newer than the recorded schema version"""
+        version = self.schema_version()
+        for target, migration in CSV_MIGRATIONS:
+            if version < target:
+                print('Migrating CSV data to schema version %d' % target)
+                migration(self)
+                self._set_schema_version(target)
+                version = target
+        if version < SCHEMA_VERSION:
+            # Versions without a CSV migration only changed the SQLite layout
+            self._set_schema_version(SCHEMA_VERSION)
+
+    def add_profile(self, values):
+        self.profiles.append(values)
+
+    def all_profiles(self):
+        return self.profiles.rows()
+
+    def visible_profiles(self):
+        return self.profiles.visible()
+
+    def profiles_by_airport(self, airport):
+        return self.profiles.by_airport(airport)
+
+    def profiles_by_location(self, airport, terminal):
+        return self.profiles.by_location(airport, terminal)
+
+    def profile_page(self, airport=None, terminal=None, cursor=None, limit=20):
+        return self.profiles.page(airport, terminal, cursor, limit)
+
+    def latest_profile(self, name, airport=None):
+        return self.profiles.latest(name, airport)
+
+    def profiles_version(self, airport):
+        return self.profiles.airport_version(airport)
+
+    def search_profiles(self, airport, query, limit=20):
+        return self.profiles.search(airport, query, limit)
+
+    def add_message(self, values):
+        self.messages.append(values)
+
+    def messages_for_user(self, user_name):
+        return self.messages.for_user(user_name)
+
+    def message_page_for_user(self, user_name, cursor=None, limit=50):
+        return self.messages.page_for_user(user_name, cursor, limit)
+
+    def message_page_for_conversation(self, first_name, second_name, cursor=None, limit=50):
+        return self.messages.page_for_conversation(first_name, second_name, cursor, limit)
+
+    def messages_since(self, user_name, after=0, limit=50):
+        return self.messages.since_for_user(user_name, after, limit)
+
+    def mark_messages_read(self, from_name, to_name, timestamp, read_at):
+        return self.messages.mark_read(self.messages.ids_for(from_name, to_name, timestamp), read_at)
+
+    def unread_count(self, user_name, from_name=None):
+        return self.messages.unread_count(user_name, from_name)
+
+    def add_verification(self, values):
+        self.verifications.append(values)
+
+    def verification_status(self, name):
+        return self.verifications.status(name, NOT_VERIFIED)
+
+    def verification_statuses(self, names):
+        return self.verifications.statuses(names)
+
+    def feed_version(self):
+        profiles, last_expired = self.profiles.visibility_version()
+        verifications = self.verifications.version()
+        modified_at = max([last_expired] + [signature[0] / 1e9 for signature in (profiles, verifications) if signature])
+        return (profiles, verifications, last_expired), modified_at
+
+    def warm_up(self):
+        for store in (self.profiles, self.messages, self.verifications):
+            store.refresh()
+
+    def compact(self):
+        self.profiles.compact(self.archive_path)
+        self.messages.compact()
+
+    def stats(self):
+        return {'backend': 'csv',
+                'writer': self.profiles.writer.stats(),
+                'profiles': self.profiles.stats(),
+                'messages': self.messages.stats(),
+                'verifications': self.verifications.stats()}
+
+
+def _columns(fields):
+    return ', '.join(fields)
+
+
+class _SqliteInsert:
+    """Group-commit sink inserting a batch of rows into one table in a single transaction"""
+
+    def __init__(self, storage, table, fields):
+        self.storage = storage
+        self.sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, _columns(fields), ', '.join('?' * len(fields)))
+
+    def commit(self, batch):
+        self.storage._write(self.sql, [[tuple(row) for row in batch]])
+
+
+class SqliteStorage(Storage):
+    """SQLite database in WAL mode: one shared writer connection, a reader per thread"""
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS profiles (id INTEGER PRIMARY KEY, %s, Expires_At REAL)' % ', '.join('%s TEXT' % f for f in PROFILE_FIELDS),
+        'CREATE TABLE IF NOT EXISTS profiles_archive (id INTEGER PRIMARY KEY, %s, Expires_At REAL)' % ', '.join('%s TEXT' % f for f in PROFILE_FIELDS),
+        'CREATE INDEX IF NOT EXISTS profiles_expiry ON profiles (Expires_At)',
+        "CREATE INDEX IF NOT EXISTS profiles_visible_location ON profiles (Airport, Terminal, id) WHERE Is_Visible = 'True'",
+        "CREATE INDEX IF NOT EXISTS profiles_visible ON profiles (id) WHERE Is_Visible = 'True'",
+        "CREATE INDEX IF NOT EXISTS profiles_visible_name ON profiles (Name, id) WHERE Is_Visible = 'True'",
+        'CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, %s)' % ', '.join('%s TEXT' % f for f in MESSAGE_FIELDS),
+        'CREATE INDEX IF NOT EXISTS messages_pair ON messages (From_Name, To_Name, id)',
+        'CREATE INDEX IF NOT EXISTS messages_recipient ON messages (To_Name, id)',
+        'CREATE TABLE IF NOT EXISTS verifications (id INTEGER PRIMARY KEY, %s)' % ', '.join('%s TEXT' % f for f in VERIFICATION_FIELDS),
+        'CREATE INDEX IF NOT EXISTS verifications_name ON verifications (Name, id)',
+        # Unread counters, kept in step with messages by triggers in the same transaction
+        'CREATE TABLE IF NOT EXISTS unread_by_user (To_Name TEXT PRIMARY KEY, Unread INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS unread_by_conversation (To_Name TEXT, From_Name TEXT, Unread INTEGER NOT NULL, '
+        'PRIMARY KEY (To_Name, From_Name)) WITHOUT ROWID',
+        "CREATE TRIGGER IF NOT EXISTS messages_count_unread AFTER INSERT ON messages WHEN NEW.Is_Read IS NOT 'True' BEGIN "
+        'INSERT INTO unread_by_user (To_Name, Unread) VALUES (NEW.To_Name, 1) '
+        'ON CONFLICT (To_Name) DO UPDATE SET Unread = Unread + 1; '
+        'INSERT INTO unread_by_conversation (To_Name, From_Name, Unread) VALUES (NEW.To_Name, NEW.From_Name, 1) '
+        'ON CONFLICT (To_Name, From_Name) DO UPDATE SET Unread = Unread + 1; END',
+        "CREATE TRIGGER IF NOT EXISTS messages_count_read AFTER UPDATE OF Is_Read ON messages "
+        "WHEN OLD.Is_Read IS NOT 'True' AND NEW.Is_Read IS 'True' BEGIN "
+        'UPDATE unread_by_user SET Unread = Unread - 1 WHERE To_Name = OLD.To_Name; '
+        'UPDATE unread_by_conversation SET Unread = Unread - 1 WHERE To_Name = OLD.To_Name AND From_Name = OLD.From_Name; END',
+    ]
+
+    def __init__(self, path, writer=None, retention=None):
+        self.path = path
+        self.writer = writer or shared_writer
+        self.retention = retention or RetentionPolicy()
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._profile_sink = _SqliteInsert(self, 'profiles', PROFILE_FIELDS + ['Expires_At'])
+        self._message_sink = _SqliteInsert(self, 'messages', MESSAGE_FIELDS)
+        self._verification_sink = _SqliteInsert(self, 'verifications', VERIFICATION_FIELDS)
+        self._search = ProfileSearch()
+        self._search_lock = threading.Lock()
+        self._search_rows = {}
+        self._search_expiring = []
+        self._search_last_id = 0
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self):
+        # Connections are per thread, and reopened in each forked worker
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.connection.row_factory = sqlite3.Row
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _writer_connection(self):
+        # Callers hold _write_lock
+        if self._writer_pid != os.getpid():
+            self._writer = self._connect()
+            # Commits are acknowledged as durable, so sync the WAL on every commit
+            self._writer.execute('PRAGMA synchronous=FULL')
+            self._writer_pid = os.getpid()
+        return self._writer
+
+    def _write(self, sql, batches):
+        """Run sql for each batch (a list of parameter tuples, or one tuple), one commit per batch"""
+        with self._write_lock:
+            self._writer_connection()
+            for batch in batches:
+                self._writer.execute('BEGIN IMMEDIATE')
+                try:
+                    if isinstance(batch, list):
+                        self._writer.executemany(sql, batch)
+                    else:
+                        self._writer.execute(sql, batch)
+                    self._writer.execute('COMMIT')
+                except BaseException:
+                    self._writer.execute('ROLLBACK')
+                    raise
+
+    def _query(self, sql, params=()):
+        with stage('sqlite_read'):
+            return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def init_schema(self):
+        with self._write_lock:
+            connection = self._connect()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    columns = [row[1] for row in connection.execute('PRAGMA table_info(profiles)')]
+                    if columns and 'Expires_At' not in columns:
+                        # Version 3: profiles carry their expiry so reads can filter on it
+                        connection.execute('ALTER TABLE profiles ADD COLUMN Expires_At REAL')
+                    counted = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'unread_by_user'").fetchone()
+                    for statement in self.SCHEMA:
+                        connection.execute(statement)
+                    if not counted:
+                        # Version 4: count the unread messages already stored
+                        self._backfill_unread(connection)
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+                self._backfill_expiry(connection)
+                connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+            finally:
+                connection.close()
+
+    def _backfill_unread(self, connection):
+        connection.execute("INSERT INTO unread_by_user (To_Name, Unread) "
+                           "SELECT To_Name, count(*) FROM messages WHERE Is_Read IS NOT 'True' GROUP BY To_Name")
+        connection.execute("INSERT INTO unread_by_conversation (To_Name, From_Name, Unread) "
+                           "SELECT To_Name, From_Name, count(*) FROM messages WHERE Is_Read IS NOT 'True' GROUP BY To_Name, From_Name")
+
+    def _backfill_expiry(self, connection):
+        rows = connection.execute('SELECT id, Departure_Time, Timestamp FROM profiles WHERE Expires_At IS NULL').fetchall()
+        updates = [(self.retention.expires_at({'Departure_Time': departure, 'Timestamp': timestamp}), profile_id)
+                   for profile_id, departure, timestamp in rows]
+        with connection:
+            connection.executemany('UPDATE profiles SET Expires_At = ? WHERE id = ?', [u for u in updates if u[0] is not None])
+
+    def _with_expiry(self, values):
+        return list(values) + [self.retention.expires_at(dict(zip(PROFILE_FIELDS, values)))]
+
+    def add_profile(self, values):
+        self.writer.submit(self._profile_sink, self._with_expiry([str(v) for v in values]))
+
+    def add_profiles(self, rows):
+        sql = 'INSERT INTO profiles (%s, Expires_At) VALUES (%s)' % (_columns(PROFILE_FIELDS), ', '.join('?' * (len(PROFILE_FIELDS) + 1)))
+        self._write(sql, _batched(self._with_expiry(values) for values in rows))
+
+    def _live(self):
+        """WHERE clause (and its parameter) excluding expired profiles"""
+        return '(Expires_At IS NULL OR Expires_At > ?)', time.time()
+
+    def _profile_select(self, where='', params=(), order='id', limit=None):
+        sql = 'SELECT id, %s FROM profiles %s ORDER BY %s' % (_columns(PROFILE_FIELDS), where, order)
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+        rows = self._query(sql, params)
+        for row in rows:
+            row.pop('id')
+        return rows
+
+    def all_profiles(self):
+        return self._profile_select()
+
+    def visible_profiles(self):
+        live, now = self._live()
+        return self._profile_select("WHERE Is_Visible = 'True' AND " + live, (now,))
+
+    def profiles_by_airport(self, airport):
+        live, now = self._live()
+        return self._profile_select("WHERE Is_Visible = 'True' AND Airport = ? AND " + live, (airport, now))
+
+    def profiles_by_location(self, airport, terminal):
+        live, now = self._live()
+        return self._profile_select("WHERE Is_Visible = 'True' AND Airport = ? AND Terminal = ? AND " + live, (airport, terminal, now))
+
+    def profile_page(self, airport=None, terminal=None, cursor=None, limit=20):
+        live, now = self._live()
+        clauses, params = ["Is_Visible = 'True'", live], [now]
+        if airport:
+            clauses.append('Airport = ?')
+            params.append(airport)
+            if terminal:
+                clauses.append('Terminal = ?')
+                params.append(terminal)
+        if cursor is not None:
+            clauses.append('id < ?')
+            params.append(cursor)
+        sql = 'SELECT id, %s FROM profiles WHERE %s ORDER BY id DESC LIMIT %d' % (_columns(PROFILE_FIELDS), ' AND '.join(clauses), limit + 1)
+        rows = self._query(sql, params)
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        rows = rows[:limit]
+        for row in rows:
+            row.pop('id')
+        return rows, next_cursor
+
+    def _sync_search(self):
+        # Callers hold _search_lock. Rows only arrive with higher ids, and leave once expired
+        now = time.time()
+        while self._search_expiring and self._search_expiring[0][0] <= now:
+            _, profile_id = heapq.heappop(self._search_expiring)
+            self._search.remove(profile_id, self._search_rows.pop(profile_id))
+        live, now = self._live()
+        rows = self._query("SELECT id, %s, Expires_At FROM profiles WHERE id > ? AND Is_Visible = 'True' AND %s ORDER BY id"
+                           % (_columns(PROFILE_FIELDS), live), (self._search_last_id, now))
+        for row in rows:
+            profile_id, expires_at = row.pop('id'), row.pop('Expires_At')
+            self._search_rows[profile_id] = row
+            self._search.add(profile_id, row)
+            if expires_at is not None:
+                heapq.heappush(self._search_expiring, (expires_at, profile_id))
+            self._search_last_id = profile_id
+
+    def search_profiles(self, airport, query, limit=20):
+        with self._search_lock:
+            self._sync_search()
+            return [(self._search_rows[profile_id], score) for profile_id, score in self._search.search(airport, query, limit)]
+
+    def latest_profile(self, name, airport=None):
+        live, now = self._live()
+        where, params = "WHERE Is_Visible = 'True' AND Name = ? AND " + live, [name, now]
+        if airport:
+            where += ' AND Airport = ?'
+            params.append(airport)
+        rows = self._profile_select(where, params, order='id DESC', limit=1)
+        return rows[0] if rows else None
+
+    def profiles_version(self, airport):
+        # Any new profile or expiry anywhere: two index lookups, cheaper than a per-airport count
+        return self._reader().execute('SELECT (SELECT max(id) FROM profiles), (SELECT max(Expires_At) FROM profiles WHERE Expires_At <= ?)',
+                                      (time.time(),)).fetchone()
+
+    def add_message(self, values):
+        self.writer.submit(self._message_sink, [str(v) for v in values])
+
+    def add_messages(self, rows):
+        # Explicit ids keep CSV row numbers as message IDs across the migration
+        sql = 'INSERT INTO messages (id, %s) VALUES (%s)' % (_columns(MESSAGE_FIELDS), ', '.join('?' * (len(MESSAGE_FIELDS) + 1)))
+        self._write(sql, _batched(rows))
+
+    def _message_rows(self, sql, params):
+        rows = self._query(sql, params)
+        for row in rows:
+            row['Message_ID'] = row.pop('id')
+        return rows
+
+    def messages_for_user(self, user_name):
+        return self._message_rows('SELECT id, %s FROM messages WHERE id IN (SELECT id FROM messages WHERE From_Name = ? '
+                                  'UNION SELECT id FROM messages WHERE To_Name = ?) ORDER BY id' % _columns(MESSAGE_FIELDS),
+                                  (user_name, user_name))
+
+    def _message_page(self, sql, params, limit):
+        rows = self._message_rows(sql, params)
+        next_cursor = rows[limit - 1]['Message_ID'] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def message_page_for_user(self, user_name, cursor=None, limit=50):
+        before = cursor if cursor is not None else 2 ** 63 - 1
+        sql = ('SELECT id, %s FROM messages WHERE id IN '
+               '(SELECT id FROM (SELECT id FROM messages WHERE From_Name = ? AND id < ? ORDER BY id DESC LIMIT ?) '
+               'UNION SELECT id FROM (SELECT id FROM messages WHERE To_Name = ? AND id < ? ORDER BY id DESC LIMIT ?)) '
+               'ORDER BY id DESC LIMIT ?' % _columns(MESSAGE_FIELDS))
+        return self._message_page(sql, (user_name, before, limit + 1, user_name, before, limit + 1, limit + 1), limit)
+
+    def message_page_for_conversation(self, first_name, second_name, cursor=None, limit=50):
+        before = cursor if cursor is not None else 2 ** 63 - 1
+        sql = ('SELECT id, %s FROM messages WHERE ((From_Name = ? AND To_Name = ?) OR (From_Name = ? AND To_Name = ?)) '
+               'AND id < ? ORDER BY id DESC LIMIT ?' % _columns(MESSAGE_FIELDS))
+        return self._message_page(sql, (first_name, second_name, second_name, first_name, before, limit + 1), limit)
+
+    def messages_since(self, user_name, after=0, limit=50):
+        sql = ('SELECT id, %s FROM messages WHERE id IN '
+               '(SELECT id FROM (SELECT id FROM messages WHERE From_Name = ? AND id > ? ORDER BY id LIMIT ?) '
+               'UNION SELECT id FROM (SELECT id FROM messages WHERE To_Name = ? AND id > ? ORDER BY id LIMIT ?)) '
+               'ORDER BY id LIMIT ?' % _columns(MESSAGE_FIELDS))
+        return self._message_rows(sql, (user_name, after, limit, user_name, after, limit, limit))
+
+    def mark_messages_read(self, from_name, to_name, timestamp, read_at):
+        # An indexed UPDATE touches only the matching rows, so SQLite needs no receipt log
+        self._write("UPDATE messages SET Is_Read = 'True' WHERE From_Name = ? AND To_Name = ? AND Timestamp = ? AND Is_Read != 'True'",
+                    [(from_name, to_name, timestamp)])
+
+    def unread_count(self, user_name, from_name=None):
+        if from_name is None:
+            rows = self._query('SELECT Unread FROM unread_by_user WHERE To_Name = ?', (user_name,))
+        else:
+            rows = self._query('SELECT Unread FROM unread_by_conversation WHERE To_Name = ? AND From_Name = ?', (user_name, from_name))
+        return rows[0]['Unread'] if rows else 0
+
+    def add_verification(self, values):
+        self.writer.submit(self._verification_sink, [str(v) for v in values])
+
+    def add_verifications(self, rows):
+        sql = 'INSERT INTO verifications (%s) VALUES (%s)' % (_columns(VERIFICATION_FIELDS), ', '.join('?' * len(VERIFICATION_FIELDS)))
+        self._write(sql, _batched(rows))
+
+    def verification_status(self, name):
+        rows = self._query('SELECT Status FROM verifications WHERE Name = ? ORDER BY id DESC LIMIT 1', (name,))
+        return rows[0]['Status'] if rows else NOT_VERIFIED
+
+    def verification_statuses(self, names):
+        names = list(names)
+        statuses = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            sql = ('SELECT Name, Status FROM verifications WHERE id IN '
+                   '(SELECT max(id) FROM verifications WHERE Name IN (%s) GROUP BY Name)' % ', '.join('?' * len(chunk)))
+            statuses.update((row['Name'], row['Status']) for row in self._query(sql, chunk))
+        return statuses
+
+    def feed_version(self):
+        profiles, verifications, last_expired = self._reader().execute(
+            'SELECT (SELECT max(id) FROM profiles), (SELECT max(id) FROM verifications), '
+            '(SELECT max(Expires_At) FROM profiles WHERE Expires_At <= ?)', (time.time(),)).fetchone()
+        mtimes = [os.stat(path).st_mtime for path in (self.path, self.path + '-wal') if os.path.exists(path)]
+        return (profiles, verifications, last_expired), max(mtimes + [last_expired or 0])
+
+    def compact(self):
+        columns = 'id, %s, Expires_At' % _columns(PROFILE_FIELDS)
+        with self._write_lock:
+            writer = self._writer_connection()
+            # Expired profiles move to profiles_archive in one transaction
+            writer.execute('BEGIN IMMEDIATE')
+            try:
+                # The newest row always stays: SQLite hands out max(id) + 1 next, and cursors
+                # and the search index rely on ids never being reused
+                expired = 'Expires_At <= ? AND id < (SELECT max(id) FROM profiles)'
+                now = time.time()
+                writer.execute('INSERT OR REPLACE INTO profiles_archive (%s) SELECT %s FROM profiles WHERE %s' % (columns, columns, expired), (now,))
+                writer.execute('DELETE FROM profiles WHERE ' + expired, (now,))
+                writer.execute('COMMIT')
+            except BaseException:
+                writer.execute('ROLLBACK')
+                raise
+            writer.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            writer.execute('PRAGMA optimize')
+
+    def stats(self):
+        counts = self._reader().execute('SELECT (SELECT count(*) FROM profiles), (SELECT count(*) FROM messages), '
+                                        '(SELECT count(*) FROM verifications)').fetchone()
+        return {'backend': 'sqlite', 'file': self.path, 'writer': self.writer.stats(),
+                'profiles': counts[0], 'messages': counts[1], 'verifications': counts[2], 'search': self._search.stats()}
+
+
+def _batched(rows, size=IMPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_csv(path, fields, defaults=None):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, None) or []
+        for values in reader:
+            if values:
+                yield align_row(header, values, fields, defaults)
+
+
+def migrate_csv_to_sqlite(database_path, profiles_path, messages_path, verifications_path, receipts_path):
+    """One-shot import of the CSV files into an empty SQLite database"""
+    storage = SqliteStorage(database_path)
+    storage.init_schema()
+    existing = storage.stats()
+    if existing['profiles'] or existing['messages'] or existing['verifications']:
+        raise SystemExit('%s already contains data; refusing to import twice' % database_path)
+
+    read_ids = {int(values[0]) for values in _read_csv(receipts_path, RECEIPT_FIELDS) if values[0].isdigit()}
+
+    def messages():
+        for message_id, values in enumerate(_read_csv(messages_path, MESSAGE_FIELDS), start=1):
+            if message_id in read_ids:
+                values[MESSAGE_FIELDS.index('Is_Read')] = 'True'
+            yield [message_id] + values
+
+    storage.add_profiles(_read_csv(profiles_path, PROFILE_FIELDS, {'Is_Verified': 'False'}))
+    storage.add_messages(messages())
+    storage.add_verifications(_read_csv(verifications_path, VERIFICATION_FIELDS))
+    return storage.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage maintenance for Connections Airport App')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    migrate = subcommands.add_parser('migrate-csv', help='import the CSV data files into a SQLite database')
+    migrate.add_argument('--db', default=os.environ.get('DATABASE_FILE', 'connections.db'))
+    migrate.add_argument('--profiles', default='airport_profiles.csv')
+    migrate.add_argument('--messages', default='messages.csv')
+    migrate.add_argument('--verifications', default='verifications.csv')
+    migrate.add_argument('--receipts', default='read_receipts.csv')
+    args = parser.parse_args()
+
+    if args.command == 'migrate-csv':
+        counts = migrate_csv_to_sqlite(args.db, args.profiles, args.messages, args.verifications, args.receipts)
+        print('✅ Imported %(profiles)d profiles, %(messages)d messages and %(verifications)d verifications into %(file)s' % counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,809 @@
+"""
+In-memory caches for the app's CSV data files
+"""
+
+import bisect
+import csv
+import heapq
+import io
+import os
+import shutil
+import threading
+import time
+import traceback
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from metrics import stage
+from search import ProfileSearch
+from writer import file_lock, shared_writer
+
+_UNLOADED = object()
+
+RECEIPT_FIELDS = ['Message_ID', 'Read_At']
+
+# Logged receipts worth rewriting the messages file for; every other process re-parses it afterwards
+MIN_RECEIPTS_TO_COMPACT = 10000
+
+
+class PeriodicTask:
+    """Calls fn every interval seconds on a daemon thread, started once per process"""
+
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.fn()
+            except Exception:
+                traceback.print_exc()
+
+
+def newest_page(keys, cursor, limit):
+    """Newest-first slice of an ascending key list below cursor, plus the next cursor"""
+    end = len(keys) if cursor is None else bisect.bisect_left(keys, cursor)
+    start = max(0, end - limit)
+    return keys[start:end][::-1], (keys[start] if start > 0 else None)
+
+
+class CsvStore:
+    """Process-wide cache of one CSV file, kept in step with it by reading what changed
+
+    Rows appended by any process are read from the end of the file the
+    cache already covers; only a rewrite (a new inode) or a truncation makes
+    it parse the whole file again.
+    """
+
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.writer = writer or shared_writer
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._lock = threading.RLock()
+        self._fieldnames = []
+        self._rows = []
+        self._signature = _UNLOADED
+        self._inode = None
+        self._reset_indexes()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def _stat_signature(self):
+        stat = self._stat()
+        return None if stat is None else (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        self.reloads += 1
+        with stage('csv_read'):
+            self._parse()
+
+    def _read_tail(self):
+        # Index the complete rows appended past the end of what the cache covers
+        offset = self._signature[1]
+        with stage('csv_read'):
+            with open(self.path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                file.seek(offset - 1)
+                data = file.read(stat.st_size - offset + 1)
+            if stat.st_ino != self._inode or data[:1] != b'\n':
+                # Rewritten in place since the stat: what the cache covers is not a prefix any more
+                self._load()
+                return
+            end = data.rfind(b'\n')
+            for values in csv.reader(io.StringIO(data[1:end + 1].decode('utf-8'), newline='')):
+                if values:
+                    row = self._as_dict(values)
+                    self._rows.append(row)
+                    self._index_row(len(self._rows) - 1, row)
+            self._signature = (stat.st_mtime_ns, offset + end)
+
+    def _parse(self):
+        fieldnames, rows, signature, inode = [], [], None, None
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                inode = stat.st_ino
+                data = file.read(stat.st_size)
+            # Stop before a row another process is still writing; the size
+            # mismatch makes the next refresh pick it up
+            end = data.rfind(b'\n') + 1
+            signature = (stat.st_mtime_ns, end)
+            reader = csv.DictReader(io.StringIO(data[:end].decode('utf-8'), newline=''))
+            rows = list(reader)
+            fieldnames = reader.fieldnames or []
+        self._fieldnames = fieldnames
+        self._rows = rows
+        self._signature = signature
+        self._inode = inode
+        self._reset_indexes()
+        for position, row in enumerate(rows):
+            self._index_row(position, row)
+
+    # Subclasses maintain secondary indexes through these two hooks
+    def _reset_indexes(self):
+        pass
+
+    def _index_row(self, position, row):
+        pass
+
+    def refresh(self):
+        """Catch up with the file if its mtime or size changed: the appended tail only if it grew, else a full reload"""
+        stat = self._stat()
+        signature = None if stat is None else (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature == self._signature:
+                self.hits += 1
+                return
+            self.misses += 1
+            if (stat is not None and self._signature not in (None, _UNLOADED) and self._fieldnames
+                    and stat.st_ino == self._inode and stat.st_size > self._signature[1] > 0):
+                self._read_tail()
+            else:
+                self._load()
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = _UNLOADED
+
+    def rows(self):
+        with self._lock:
+            self.refresh()
+            return list(self._rows)
+
+    def version(self):
+        """The file signature the cache reflects; every process reading the same file sees the same one"""
+        with self._lock:
+            self.refresh()
+            return self._signature
+
+    def _as_dict(self, values):
+        # Mirror csv.DictReader so appended rows look like re-read ones
+        row = dict(zip(self._fieldnames, values))
+        if len(values) > len(self._fieldnames):
+            row[None] = values[len(self._fieldnames):]
+        for key in self._fieldnames[len(values):]:
+            row[key] = None
+        return row
+
+    def append(self, values):
+        """Queue one row with the group-commit writer and wait until it is durable"""
+        self.writer.submit(self, ['' if value is None else str(value) for value in values])
+
+    def commit(self, batch):
+        """Append a batch of rows with one write and one fsync (called by the writer thread)"""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        data = buffer.getvalue().encode('utf-8')
+        with file_lock(self.lock_path):
+            before = self._stat_signature()
+            with open(self.path, 'ab') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            after = self._stat_signature()
+        with self._lock:
+            if self._signature == after:
+                return
+            if before is not None and self._signature == before:
+                # The cache mirrored the file right before this batch, so extend it in place
+                for values in batch:
+                    row = self._as_dict(values)
+                    self._rows.append(row)
+                    self._index_row(len(self._rows) - 1, row)
+                self._signature = after
+            else:
+                self._signature = _UNLOADED
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'file': self.path,
+                'rows': len(self._rows),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class RetentionPolicy:
+    """How long a profile stays listed: until grace after its departure, and never longer than max_age"""
+
+    def __init__(self, grace=timedelta(hours=1), max_age=timedelta(hours=24)):
+        self.grace = grace
+        self.max_age = max_age
+
+    def expires_at(self, row):
+        """Epoch seconds at which the profile expires, or None without a readable Timestamp"""
+        try:
+            checked_in = datetime.fromisoformat(row.get('Timestamp') or '')
+        except ValueError:
+            return None
+        expires_at = checked_in + self.max_age
+        try:
+            hours, minutes = (row.get('Departure_Time') or '').split(':')[:2]
+            departure = checked_in.replace(hour=int(hours), minute=int(minutes), second=0, microsecond=0)
+        except ValueError:
+            return expires_at.timestamp()
+        # Departure_Time has no date: it is the next time of day at that clock time after check-in
+        if departure < checked_in - self.grace:
+            departure += timedelta(days=1)
+        return min(departure + self.grace, expires_at).timestamp()
+
+    def is_expired(self, row, now=None):
+        expires_at = self.expires_at(row)
+        return expires_at is not None and expires_at <= (time.time() if now is None else now)
+
+
+def _discard(positions, position):
+    index = bisect.bisect_left(positions, position)
+    if index < len(positions) and positions[index] == position:
+        del positions[index]
+
+
+class ProfileStore(CsvStore):
+    """Profile cache with visible-profile indexes by Airport and (Airport, Terminal)
+
+    With a retention policy, expired profiles never enter the indexes and
+    live ones leave them as soon as they expire; compact() later moves the
+    expired rows out of the file. The text search index is built on the
+    first search and then kept up to date row by row like the others.
+
+    Page cursors are row ids, which compaction does not change. A row's id
+    is its position until the first compaction; from then on a sidecar file
+    (path + '.ids') lists the ids of the rows the compacted file kept, and
+    rows appended later count on from the next id it records.
+    """
+
+    def __init__(self, path, writer=None, retention=None):
+        self.retention = retention
+        self.ids_path = path + '.ids'
+        self.expired = 0
+        self.archived = 0
+        self._ids = array('q')
+        self._next_id = 0
+        super().__init__(path, writer)
+
+    def _load(self):
+        # The sidecar is swapped in before the data file, so read it after the data
+        super()._load()
+        self._ids, self._next_id = self._read_row_ids()
+
+    def _read_row_ids(self):
+        try:
+            with open(self.ids_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return array('q'), 0
+        ids = array('q')
+        ids.frombytes(data[:len(data) // ids.itemsize * ids.itemsize])
+        if len(ids) < 2:
+            return array('q'), 0
+        if ids[0] != self._inode:
+            # The data file is not the one the ids were written for (a crash mid-compaction,
+            # or a rewrite by a migration): number every row after the ids already handed out
+            return array('q'), ids[1]
+        return ids[2:], ids[1]
+
+    def _row_id(self, position):
+        if position < len(self._ids):
+            return self._ids[position]
+        return self._next_id + position - len(self._ids)
+
+    def _position(self, row_id):
+        """Position of the first row whose id is row_id or above"""
+        if row_id >= self._next_id:
+            return len(self._ids) + row_id - self._next_id
+        return bisect.bisect_left(self._ids, row_id)
+
+    def _reset_indexes(self):
+        self._generation = getattr(self, '_generation', 0) + 1
+        self._visible = []
+        self._by_airport = {}
+        self._by_location = {}
+        self._by_name = {}
+        self._expiring = []
+        self._last_expired = 0.0
+        self._search = None
+
+    def _index_row(self, position, row):
+        if row.get('Is_Visible') != 'True':
+            return
+        if self.retention is not None:
+            expires_at = self.retention.expires_at(row)
+            if expires_at is not None:
+                if expires_at <= time.time():
+                    self._last_expired = max(self._last_expired, expires_at)
+                    return
+                heapq.heappush(self._expiring, (expires_at, position))
+        airport, terminal = row.get('Airport'), row.get('Terminal')
+        self._visible.append(position)
+        self._by_airport.setdefault(airport, []).append(position)
+        self._by_location.setdefault((airport, terminal), []).append(position)
+        self._by_name.setdefault(row.get('Name'), []).append(position)
+        if self._search is not None:
+            self._search.add(position, row)
+
+    def _drop_expired(self):
+        # Positions are sorted in every index, so each removal is a bisect and one delete
+        now = time.time()
+        while self._expiring and self._expiring[0][0] <= now:
+            expires_at, position = heapq.heappop(self._expiring)
+            self._last_expired = max(self._last_expired, expires_at)
+            row = self._rows[position]
+            airport, terminal = row.get('Airport'), row.get('Terminal')
+            _discard(self._visible, position)
+            _discard(self._by_airport.get(airport, []), position)
+            _discard(self._by_location.get((airport, terminal), []), position)
+            _discard(self._by_name.get(row.get('Name'), []), position)
+            if self._search is not None:
+                self._search.remove(position, row)
+            self.expired += 1
+
+    def _current(self):
+        self.refresh()
+        self._drop_expired()
+
+    def visibility_version(self):
+        """(file signature, latest expiry already passed): changes whenever the visible set does"""
+        with self._lock:
+            self._current()
+            return self._signature, self._last_expired
+
+    def visible(self):
+        with self._lock:
+            self._current()
+            return [self._rows[position] for position in self._visible]
+
+    def by_airport(self, airport):
+        with self._lock:
+            self._current()
+            return [self._rows[position] for position in self._by_airport.get(airport, ())]
+
+    def by_location(self, airport, terminal):
+        with self._lock:
+            self._current()
+            return [self._rows[position] for position in self._by_location.get((airport, terminal), ())]
+
+    def latest(self, name, airport=None):
+        """Newest visible profile for a name, optionally only at airport, or None"""
+        with self._lock:
+            self._current()
+            for position in reversed(self._by_name.get(name, ())):
+                row = self._rows[position]
+                if not airport or row.get('Airport') == airport:
+                    return row
+            return None
+
+    def airport_version(self, airport):
+        """Token that changes whenever the visible profiles at airport do"""
+        with self._lock:
+            self._current()
+            # Indexes only gain rows at the end or lose expired ones until they are rebuilt
+            positions = self._by_airport.get(airport) or [None]
+            return self._generation, len(positions), positions[0], positions[-1]
+
+    def page(self, airport=None, terminal=None, cursor=None, limit=20):
+        """Newest-first page of visible profiles with row ids below cursor, plus the next cursor"""
+        with self._lock:
+            self._current()
+            if airport and terminal:
+                positions = self._by_location.get((airport, terminal), [])
+            elif airport:
+                positions = self._by_airport.get(airport, [])
+            else:
+                positions = self._visible
+            page, next_position = newest_page(positions, None if cursor is None else self._position(cursor), limit)
+            next_cursor = None if next_position is None else self._row_id(next_position)
+            return [self._rows[position] for position in page], next_cursor
+
+    def search(self, airport, query, limit=20):
+        """Best (row, score) matches for query among the visible profiles at airport"""
+        with self._lock:
+            self._current()
+            if self._search is None:
+                self._search = ProfileSearch()
+                for position in self._visible:
+                    self._search.add(position, self._rows[position])
+            return [(self._rows[position], score) for position, score in self._search.search(airport, query, limit)]
+
+    def compact(self, archive_path):
+        """Move expired profiles to archive_path and atomically rewrite the file without them
+
+        The split and the new files are made from a snapshot without holding
+        the cache lock; the file lock and cache lock are then held only to
+        archive, copy over rows appended meanwhile, swap the files in and
+        renumber the indexes.
+        """
+        if self.retention is None:
+            return 0
+        with self._lock:
+            self.refresh()
+            rows = self._rows[:]
+            fieldnames = list(self._fieldnames)
+            inode, offset = self._inode, self._signature[1]
+            ids, next_id = self._ids, self._next_id
+
+        now = time.time()
+        kept, kept_ids, expired = [], array('q'), []
+        # New position of every snapshot row, -1 for the ones leaving
+        moves = array('q')
+        for position, row in enumerate(rows):
+            if self.retention.is_expired(row, now):
+                expired.append(row)
+                moves.append(-1)
+            else:
+                moves.append(len(kept))
+                kept.append(row)
+                kept_ids.append(ids[position] if position < len(ids) else next_id + position - len(ids))
+        if not expired:
+            return 0
+        new_next_id = next_id + len(rows) - len(ids)
+        archive = io.StringIO()
+        csv.writer(archive).writerows([row.get(name) for name in fieldnames] for row in expired)
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        ids_temp_path = '%s.%d.tmp' % (self.ids_path, os.getpid())
+        with open(temp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(fieldnames)
+            writer.writerows([row.get(name) for name in fieldnames] for row in kept)
+            new_inode = os.fstat(file.fileno()).st_ino
+        with open(ids_temp_path, 'wb') as file:
+            array('q', [new_inode, new_next_id]).tofile(file)
+            kept_ids.tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        with self._lock, file_lock(self.lock_path):
+            stat = self._stat()
+            if stat is None or stat.st_ino != inode or stat.st_size < offset or self._inode != inode:
+                # Another process compacted first
+                os.remove(temp_path)
+                os.remove(ids_temp_path)
+                return 0
+            # Archive before the swap: a crash in between duplicates archived rows but never loses one
+            with open(archive_path, 'a', newline='') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    csv.writer(file).writerow(fieldnames)
+                file.write(archive.getvalue())
+                file.flush()
+                os.fsync(file.fileno())
+            written = _append_tail(self.path, offset, temp_path)
+            # The ids go in first: a crash before the data swap leaves them naming another file,
+            # and readers then number rows from next_id, so ids only ever grow
+            os.replace(ids_temp_path, self.ids_path)
+            os.replace(temp_path, self.path)
+            self._renumber(moves, kept)
+            stat = os.stat(self.path)
+            covered = written + self._signature[1] - offset
+            self._inode = stat.st_ino
+            self._signature = (stat.st_mtime_ns, covered) if covered == stat.st_size else (0, covered)
+            self._ids, self._next_id = kept_ids, new_next_id
+            self.archived += len(expired)
+            return len(expired)
+
+    def _renumber(self, moves, kept):
+        # Callers hold _lock. Compaction only removes rows, so every index keeps its order under the new positions
+        self._drop_expired()
+        removed = len(moves) - len(kept)
+        moves_array = np.frombuffer(moves, dtype=np.int64)
+
+        def moved(positions):
+            positions = np.asarray(positions, dtype=np.int64)
+            return np.where(positions < len(moves), moves_array[np.minimum(positions, len(moves) - 1)], positions - removed)
+
+        def renumbered(positions):
+            if len(positions) < 64:
+                # Arrays only pay off for the long lists; most names have a position or two
+                return [moves[position] if position < len(moves) else position - removed
+                        for position in positions if position >= len(moves) or moves[position] >= 0]
+            positions = moved(positions)
+            return positions[positions >= 0].tolist()
+
+        self._rows = kept + self._rows[len(moves):]
+        self._visible = renumbered(self._visible)
+        for index in (self._by_airport, self._by_location, self._by_name):
+            for key, positions in index.items():
+                index[key] = renumbered(positions)
+        if self._expiring:
+            positions = moved(np.fromiter((position for _, position in self._expiring), dtype=np.int64, count=len(self._expiring)))
+            self._expiring = [(entry[0], position) for entry, position in zip(self._expiring, positions.tolist()) if position >= 0]
+            heapq.heapify(self._expiring)
+        self._search = None
+        self._generation += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(expired=self.expired, archived=self.archived)
+        with self._lock:
+            stats['search'] = self._search.stats() if self._search is not None else None
+        return stats
+
+
+def conversation_key(first_name, second_name):
+    return (first_name, second_name) if first_name <= second_name else (second_name, first_name)
+
+
+class MessageStore(CsvStore):
+    """Message cache whose Is_Read flags merge an append-only read-receipt log
+
+    A message's ID is its 1-based row number in the messages file. Rows are
+    only ever appended, so IDs are stable and increase with every message.
+    Unread counters per recipient and per (recipient, sender) move with each
+    indexed row and applied receipt, so they are rebuilt from the files on load.
+    """
+
+    def __init__(self, path, receipts_path, min_receipts=MIN_RECEIPTS_TO_COMPACT):
+        self.receipts_path = receipts_path
+        self.min_receipts = min_receipts
+        self._read_ids = set()
+        self._receipts_signature = None
+        self._receipts_offset = 0
+        super().__init__(path)
+
+    def _reset_indexes(self):
+        self._by_key = {}
+        self._by_user = {}
+        self._by_conversation = {}
+        self._unread_by_user = {}
+        self._unread_by_conversation = {}
+
+    def _index_row(self, position, row):
+        message_id = position + 1
+        row['Message_ID'] = message_id
+        if message_id in self._read_ids:
+            row['Is_Read'] = 'True'
+        else:
+            self._count_unread(row, 1)
+        from_name, to_name = row.get('From_Name'), row.get('To_Name')
+        self._by_key.setdefault((from_name, to_name, row.get('Timestamp')), []).append(message_id)
+        self._by_user.setdefault(from_name, []).append(message_id)
+        if to_name != from_name:
+            self._by_user.setdefault(to_name, []).append(message_id)
+        self._by_conversation.setdefault(conversation_key(from_name, to_name), []).append(message_id)
+
+    def _load(self):
+        self._read_ids = set()
+        self._receipts_signature = None
+        self._receipts_offset = 0
+        self._read_receipts()
+        super()._load()
+
+    def refresh(self):
+        with self._lock:
+            super().refresh()
+            self._read_receipts()
+
+    def _receipts_stat(self):
+        try:
+            stat = os.stat(self.receipts_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def _read_receipts(self):
+        # Apply receipt records appended since the last read, by any process
+        signature = self._receipts_stat()
+        if signature == self._receipts_signature:
+            return
+        if signature is None:
+            self._receipts_signature = None
+            self._receipts_offset = 0
+            return
+        if self._receipts_signature is None or signature[0] != self._receipts_signature[0] or signature[1] < self._receipts_offset:
+            self._receipts_offset = 0
+        with open(self.receipts_path, 'rb') as file:
+            file.seek(self._receipts_offset)
+            data = file.read()
+        # Leave a partially written trailing record for the next read
+        end = data.rfind(b'\n') + 1
+        for record in csv.reader(data[:end].decode().splitlines()):
+            if record and record[0].isdigit():
+                self._apply_read(int(record[0]))
+        self._receipts_offset += end
+        self._receipts_signature = (signature[0], self._receipts_offset)
+
+    def _count_unread(self, row, delta):
+        if row.get('Is_Read') == 'True':
+            return
+        to_name = row.get('To_Name')
+        for counters, key in ((self._unread_by_user, to_name), (self._unread_by_conversation, (to_name, row.get('From_Name')))):
+            count = counters.get(key, 0) + delta
+            if count:
+                counters[key] = count
+            else:
+                counters.pop(key, None)
+
+    def _apply_read(self, message_id):
+        self._read_ids.add(message_id)
+        if 0 < message_id <= len(self._rows):
+            row = self._rows[message_id - 1]
+            self._count_unread(row, -1)
+            row['Is_Read'] = 'True'
+
+    def _is_read(self, message_id):
+        if message_id in self._read_ids:
+            return True
+        return 0 < message_id <= len(self._rows) and self._rows[message_id - 1].get('Is_Read') == 'True'
+
+    def unread_count(self, user_name, from_name=None):
+        """Unread messages sent to a user, or only those from from_name"""
+        with self._lock:
+            self.refresh()
+            if from_name is None:
+                return self._unread_by_user.get(user_name, 0)
+            return self._unread_by_conversation.get((user_name, from_name), 0)
+
+    def for_user(self, user_name):
+        """Every message a user sent or received, oldest first"""
+        with self._lock:
+            self.refresh()
+            return [self._rows[message_id - 1] for message_id in self._by_user.get(user_name, ())]
+
+    def page_for_user(self, user_name, cursor=None, limit=50):
+        """Newest messages a user sent or received with IDs below cursor, plus the next cursor"""
+        with self._lock:
+            self.refresh()
+            page, next_cursor = newest_page(self._by_user.get(user_name, []), cursor, limit)
+            return [self._rows[message_id - 1] for message_id in page], next_cursor
+
+    def since_for_user(self, user_name, after=0, limit=50):
+        """Oldest-first messages a user sent or received with IDs above after, up to limit"""
+        with self._lock:
+            self.refresh()
+            keys = self._by_user.get(user_name, [])
+            # Nothing new is the common case for pollers; answer it without slicing
+            if not keys or keys[-1] <= after:
+                return []
+            start = bisect.bisect_right(keys, after)
+            return [self._rows[message_id - 1] for message_id in keys[start:start + limit]]
+
+    def page_for_conversation(self, first_name, second_name, cursor=None, limit=50):
+        """Newest messages between two users with IDs below cursor, plus the next cursor"""
+        with self._lock:
+            self.refresh()
+            keys = self._by_conversation.get(conversation_key(first_name, second_name), [])
+            page, next_cursor = newest_page(keys, cursor, limit)
+            return [self._rows[message_id - 1] for message_id in page], next_cursor
+
+    def ids_for(self, from_name, to_name, timestamp):
+        with self._lock:
+            self.refresh()
+            return list(self._by_key.get((from_name, to_name, timestamp), ()))
+
+    def mark_read(self, message_ids, read_at):
+        """Append read receipts for unread messages; returns the IDs newly marked"""
+        with self._lock:
+            self.refresh()
+            message_ids = [message_id for message_id in dict.fromkeys(message_ids) if not self._is_read(message_id)]
+            if not message_ids:
+                return []
+            was_current = self._receipts_stat() == self._receipts_signature
+            with file_lock(self.lock_path), open(self.receipts_path, 'a', newline='') as file:
+                start = os.fstat(file.fileno()).st_size
+                writer = csv.writer(file)
+                if start == 0:
+                    writer.writerow(RECEIPT_FIELDS)
+                writer.writerows([message_id, read_at] for message_id in message_ids)
+                file.flush()
+                stat = os.fstat(file.fileno())
+            for message_id in message_ids:
+                self._apply_read(message_id)
+            if was_current and start == self._receipts_offset:
+                self._receipts_offset = stat.st_size
+                self._receipts_signature = (stat.st_ino, stat.st_size)
+            return message_ids
+
+    def compact(self):
+        """Fold logged read receipts into the messages file and start a fresh log
+
+        Only runs once min_receipts receipts have built up. The new files are
+        written from a snapshot without holding the cache lock; the file lock
+        and cache lock are then held just long enough to copy over whatever
+        was appended meanwhile and swap the files in.
+        """
+        with self._lock:
+            self.refresh()
+            if len(self._read_ids) < self.min_receipts or self._receipts_signature is None:
+                return 0
+            rows = self._rows[:]
+            fieldnames = list(self._fieldnames)
+            inode, offset = self._inode, self._signature[1]
+            receipts_inode, receipts_offset = self._receipts_signature[0], self._receipts_offset
+            folded = {message_id for message_id in self._read_ids if message_id <= len(rows)}
+            # Receipts for messages this process has not loaded yet stay in the log
+            carried = sorted(message_id for message_id in self._read_ids if message_id > len(rows))
+
+        # Folded rows already say Is_Read = 'True'; a receipt applied while writing only folds it twice
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        receipts_temp_path = '%s.%d.tmp' % (self.receipts_path, os.getpid())
+        with open(temp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(fieldnames)
+            writer.writerows([row.get(name) for name in fieldnames] for row in rows)
+        with open(receipts_temp_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(RECEIPT_FIELDS)
+            writer.writerows([message_id, ''] for message_id in carried)
+
+        with self._lock, file_lock(self.lock_path):
+            stat, receipts_stat = self._stat(), self._receipts_stat()
+            if (stat is None or stat.st_ino != inode or stat.st_size < offset
+                    or receipts_stat is None or receipts_stat[0] != receipts_inode or receipts_stat[1] < receipts_offset):
+                # Another process compacted first
+                os.remove(temp_path)
+                os.remove(receipts_temp_path)
+                return 0
+            written = _append_tail(self.path, offset, temp_path)
+            receipts_written = _append_tail(self.receipts_path, receipts_offset, receipts_temp_path)
+            os.replace(temp_path, self.path)
+            os.replace(receipts_temp_path, self.receipts_path)
+            if self._inode != inode or self._receipts_signature is None or self._receipts_signature[0] != receipts_inode:
+                self._signature = _UNLOADED
+                return len(folded)
+            # The cache holds the same rows; only its offsets move into the new files
+            stat = os.stat(self.path)
+            covered = written + self._signature[1] - offset
+            self._inode = stat.st_ino
+            self._signature = (stat.st_mtime_ns, covered) if covered == stat.st_size else (0, covered)
+            self._receipts_offset = receipts_written + self._receipts_offset - receipts_offset
+            self._receipts_signature = (os.stat(self.receipts_path).st_ino, self._receipts_offset)
+            self._read_ids -= folded
+            return len(folded)
+
+
+def _append_tail(source_path, offset, target_path):
+    """Append source's bytes past offset to target and fsync it; returns target's size before the append"""
+    with open(source_path, 'rb') as source, open(target_path, 'ab') as target:
+        written = target.tell()
+        source.seek(offset)
+        shutil.copyfileobj(source, target)
+        target.flush()
+        os.fsync(target.fileno())
+    return written
+
+
+class VerificationStore(CsvStore):
+    """Verification cache with a map from name to that name's latest status"""
+
+    def _reset_indexes(self):
+        self._latest = {}
+
+    def _index_row(self, position, row):
+        # Rows are in append order, so the last one seen per name is the latest
+        self._latest[row.get('Name')] = row.get('Status')
+
+    def status(self, name, default=None):
+        with self._lock:
+            self.refresh()
+            return self._latest.get(name, default)
+
+    def statuses(self, names):
+        """Latest status for each name that has one, in a single pass under the lock"""
+        with self._lock:
+            self.refresh()
+            return {name: self._latest[name] for name in names if name in self._latest}
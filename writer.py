@@ -0,0 +1,105 @@
+"""
+Single-writer queue with group commit for the app's appends
+"""
+
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from metrics import stage
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; appends are then only safe within one process
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process (and thread) that opens path"""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class GroupCommitWriter:
+    """Writer thread that commits queued rows in batches
+
+    Requests call submit(sink, row) and block until the row is durable. The
+    thread collects whatever is queued within window seconds (up to
+    max_batch rows) and hands each sink its rows in one sink.commit(rows) call,
+    so concurrent requests share one write and one fsync.
+    """
+
+    def __init__(self, window=0.001, max_batch=500):
+        self.window = window
+        self.max_batch = max_batch
+        self.commits = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def submit(self, sink, row):
+        future = Future()
+        with stage('write'):
+            self._ensure_running().put((sink, row, future))
+            return future.result()
+
+    def _ensure_running(self):
+        # The thread (and anything queued) does not survive fork; each worker starts its own
+        if self._pid == os.getpid():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name='group-commit-writer', daemon=True).start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(pending.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception:
+                traceback.print_exc()
+
+    def _commit(self, batch):
+        groups = {}
+        for sink, row, future in batch:
+            groups.setdefault(sink, []).append((row, future))
+        for sink, entries in groups.items():
+            try:
+                sink.commit([row for row, _ in entries])
+            except BaseException as e:
+                for _, future in entries:
+                    future.set_exception(e)
+                continue
+            self.commits += 1
+            self.rows += len(entries)
+            for _, future in entries:
+                future.set_result(None)
+
+    def stats(self):
+        return {'commits': self.commits, 'rows': self.rows,
+                'rows_per_commit': round(self.rows / self.commits, 2) if self.commits else 0.0}
+
+
+# One writer per process, shared by every store
+shared_writer = GroupCommitWriter()